@@ -0,0 +1,275 @@
+# Бенчмарк горячих путей модуля StarlinkTracker.
+#
+# Запускается без Telegram и без сети: Hikka заменяется заглушками, данные TLE генерируются
+# детерминированно (фиксированное зерно и эпоха), положения считаются на фиксированный момент.
+# Карта отрисовывается с грубым контуром материков из benchmarks/topojson вместо загрузки
+# topojson с CDN plotly.
+#
+#   python benchmarks/starlink_tracker.py                  # замер и сравнение с baseline
+#   python benchmarks/starlink_tracker.py --save-baseline  # сохранить результаты как baseline
+#   python benchmarks/starlink_tracker.py --only propagate # только подходящие замеры
+#   python benchmarks/starlink_tracker.py --only render --save-baseline  # обновить в baseline только их
+#
+# Для каждого замера выводятся операции в секунду, медиана одного вызова и пик памяти (tracemalloc).
+# Замер, который медленнее baseline больше чем на --tolerance, помечается как регрессия,
+# и скрипт завершается с кодом 1.
+
+import argparse
+import asyncio
+import functools
+import gc
+import importlib.util
+import json
+import math
+import os
+import pathlib
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "starlink_tracker.baseline.json")
+TOPOJSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "topojson")
+FIXTURE_SIZE = 9000
+FIXTURE_SEED = 20261018
+
+
+def tle_checksum(line):
+    return sum(int(c) if c.isdigit() else c == "-" for c in line[:68]) % 10
+
+
+def tle_exponent(value):
+    """Поле вида ' 12345-3' (0.12345e-3) из числа"""
+    if value == 0:
+        return " 00000-0"
+    exponent = math.floor(math.log10(abs(value))) + 1
+    mantissa = round(abs(value) / 10.0 ** exponent * 100000)
+    if mantissa == 100000:
+        mantissa, exponent = 10000, exponent + 1
+    return f"{'-' if value < 0 else ' '}{mantissa:05d}{'-' if exponent < 0 else '+'}{abs(exponent)}"
+
+
+def make_fixture(count=FIXTURE_SIZE, seed=FIXTURE_SEED):
+    """Синтетический каталог TLE, похожий на Starlink: пять оболочек, запуски по 60 спутников.
+
+    Одинаковые count и seed всегда дают одинаковый текст."""
+    rng = random.Random(seed)
+    shells = [(53.0, 550), (53.2, 540), (70.0, 570), (97.6, 560), (43.0, 530)]
+    records = []
+    for number in range(count):
+        inclination, altitude = shells[number % len(shells)]
+        axis = 6378.137 + altitude + rng.uniform(-15, 15)
+        motion = 86400 / (2 * math.pi * math.sqrt(axis ** 3 / 398600.4418))
+        satnum = 44000 + number
+        designator = f"{19 + number * 7 // count:02d}{1 + number // 60 % 300:03d}{chr(65 + number % 20)}"
+        ndot = rng.uniform(-1e-5, 5e-5)
+        line1 = (
+            f"1 {satnum:05d}U {designator:<8} 26{290 + rng.uniform(0, 2):012.8f} "
+            f"{'-' if ndot < 0 else ' '}{f'{abs(ndot):.8f}'[1:]} {tle_exponent(0)} "
+            f"{tle_exponent(rng.uniform(1e-5, 5e-4))} 0  999"
+        )
+        line2 = (
+            f"2 {satnum:05d} {inclination:8.4f} {rng.uniform(0, 360):8.4f} {rng.randint(1, 3000):07d} "
+            f"{rng.uniform(0, 360):8.4f} {rng.uniform(0, 360):8.4f} {motion:11.8f}{rng.randint(1, 99999):5d}"
+        )
+        records.append(
+            f"STARLINK-{1000 + number}\n{line1}{tle_checksum(line1)}\n{line2}{tle_checksum(line2)}\n"
+        )
+    return "".join(records)
+
+
+def load_module(name="StarlinkTracker"):
+    """Импортирует модуль из modules/ с заглушками loader и utils вместо Hikka"""
+    package = types.ModuleType("hikka_stub")
+    package.__path__ = []
+    modules = types.ModuleType("hikka_stub.modules")
+    modules.__path__ = [os.path.join(ROOT, "modules")]
+
+    loader = types.ModuleType("hikka_stub.loader")
+    loader.tds = lambda cls: cls
+    loader.Module = type("Module", (), {})
+    loader.command = lambda *args, **kwargs: (lambda func: func)
+    loader.ConfigValue = lambda option, default, *args, **kwargs: (option, default)
+    loader.ModuleConfig = lambda *values: dict(values)
+    loader.validators = types.SimpleNamespace(Integer=lambda *args, **kwargs: None)
+
+    utils = types.ModuleType("hikka_stub.utils")
+
+    async def run_sync(func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    utils.run_sync = run_sync
+    package.loader, package.utils = loader, utils
+    sys.modules.update({
+        "hikka_stub": package,
+        "hikka_stub.modules": modules,
+        "hikka_stub.loader": loader,
+        "hikka_stub.utils": utils,
+    })
+
+    try:
+        importlib.import_module("telethon.tl.types")
+    except ImportError:
+        telethon = types.ModuleType("telethon.tl.types")
+        telethon.Message = object
+        sys.modules.setdefault("telethon", types.ModuleType("telethon"))
+        sys.modules.setdefault("telethon.tl", types.ModuleType("telethon.tl"))
+        sys.modules["telethon.tl.types"] = telethon
+
+    spec = importlib.util.spec_from_file_location(
+        f"hikka_stub.modules.{name}", os.path.join(ROOT, "modules", f"{name}.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(func, min_time, min_runs=3):
+    """Операции в секунду, медиана одного вызова (с) и пик памяти (байты) для func()"""
+    func()
+    gc.collect()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    durations = []
+    started = time.perf_counter()
+    while len(durations) < min_runs or time.perf_counter() - started < min_time:
+        call = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - call)
+    return {
+        "ops_per_sec": len(durations) / sum(durations),
+        "median_s": statistics.median(durations),
+        "peak_bytes": peak,
+        "runs": len(durations),
+    }
+
+
+def cases(tracker, text):
+    """Замеры по имени: функции без аргументов, которые выполняют одну операцию"""
+    mod = tracker.StarlinkTrackerMod()
+    ts = mod._get_timescale()
+    moment = ts.utc(2026, 10, 18, 12)
+    names, elements = mod._parse_tle(text)
+
+    catalogues = {}
+    for size in (100, 1000, 5000, len(names)):
+        catalogue = mod._make_catalogue(names[:size], elements[:size], fetched=0)
+        mod._get_propagator(catalogue)
+        catalogues["all" if size == len(names) else size] = catalogue
+
+    positions = mod._propagate(catalogues["all"], moment)
+    index = mod._build_index(positions["xyz"])
+    queries = iter(range(10 ** 9))
+
+    def nearest():
+        point = positions["xyz"][next(queries) % len(names)]
+        mod._query_nearest(index, point, 6)
+
+    figures = [None]
+
+    async def capture(figure, width, height):
+        figures[0] = figure
+        return b""
+
+    mod._render = capture
+
+    def figure(count):
+        selected = mod._select(positions, slice(0, count))
+        return lambda: asyncio.run(mod._generate_map(selected))
+
+    figure(100)()
+    sample = figures[0]
+
+    # kaleido берёт world_110m.json из этого каталога, а не из сети
+    if tracker.pio.kaleido.scope is not None:
+        tracker.pio.kaleido.scope.topojson = pathlib.Path(TOPOJSON).as_uri() + "/"
+
+    def render():
+        tracker.pio.to_image(sample, format="png", width=1200, height=600)
+
+    result = {"parse": lambda: mod._parse_tle(text), "build_satrecs": lambda: mod._build_satrecs(elements)}
+    for size, catalogue in catalogues.items():
+        result[f"propagate_{size}"] = functools.partial(mod._propagate, catalogue, moment)
+    result.update({
+        "build_index": lambda: mod._build_index(positions["xyz"]),
+        "nearest": nearest,
+        "map_figure_100": figure(100),
+        "map_figure_all": figure(len(names)),
+        "map_render_100": render,
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк StarlinkTracker")
+    parser.add_argument("--only", help="запускать только замеры, в имени которых есть эта строка")
+    parser.add_argument("--min-time", type=float, default=1.0, help="минимальное время одного замера, с")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="допустимое замедление относительно baseline")
+    parser.add_argument("--baseline", default=BASELINE, help="путь к файлу baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="записать результаты как новый baseline")
+    args = parser.parse_args()
+
+    tracker = load_module()
+    text = make_fixture()
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    machine = f"{platform.machine()}, {os.cpu_count()} CPU, Python {platform.python_version()}"
+    if baseline and baseline.get("machine") != machine:
+        print(f"⚠ baseline снят на другой машине ({baseline.get('machine')}), сравнение ориентировочное")
+
+    results, regressions = {}, []
+    print(f"{'замер':<20} {'оп/с':>10} {'медиана':>12} {'пик памяти':>12}  baseline")
+    for name, func in cases(tracker, text).items():
+        if args.only and args.only not in name:
+            continue
+        reference = baseline.get("results", {}).get(name)
+        try:
+            result = measure(func, args.min_time)
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"
+            # Замер из baseline, который перестал выполняться, - регрессия; пропуском считается
+            # только замер без записи в baseline (например, отрисовка без kaleido или сети)
+            if reference:
+                print(f"{name:<20} ошибка: {error}"[:120] + "  РЕГРЕССИЯ")
+                regressions.append(name)
+            else:
+                print(f"{name:<20} пропущен: {error}"[:120])
+            continue
+        results[name] = result
+
+        note = ""
+        if reference:
+            change = result["ops_per_sec"] / reference["ops_per_sec"] - 1
+            note = f"{change:+.0%}"
+            if change < -args.tolerance:
+                note += "  РЕГРЕССИЯ"
+                regressions.append(name)
+        print(
+            f"{name:<20} {result['ops_per_sec']:>10.1f} {result['median_s'] * 1000:>9.2f} мс "
+            f"{result['peak_bytes'] / 2 ** 20:>9.1f} МБ  {note}"
+        )
+
+    if args.save_baseline:
+        # С --only остальные замеры baseline сохраняются как были
+        if args.only:
+            results = {**baseline.get("results", {}), **results}
+        with open(args.baseline, "w") as file:
+            json.dump({"machine": machine, "fixture": [FIXTURE_SIZE, FIXTURE_SEED], "results": results}, file, indent=2)
+        print(f"baseline сохранён: {args.baseline}")
+    if regressions:
+        print(f"Регрессии: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,15 +4,281 @@
 # 🔒 Licensed under the GNU AGPLv3
 # 🌐 https://www.gnu.org/licenses/agpl-3.0.html
 
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
 from .. import loader, utils
 from telethon.tl.types import Message
 import aiohttp
+import asyncio
+import bisect
+import difflib
+from datetime import datetime, timezone
+import functools
+import importlib
 import io
-import plotly.graph_objects as go
-from skyfield.api import load, EarthSatellite
-import numpy as np
-from telegraph import Telegraph
-import speedtest
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class _LazyModule:
+    """Модуль, который импортируется при первом обращении к его атрибуту.
+
+    Тяжёлые зависимости (numpy, plotly, skyfield, sgp4, telegraph, speedtest) нужны только командам,
+    поэтому загрузка модуля Hikka их не импортирует."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            started = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            logger.debug(f"{self._name} импортирован за {(time.perf_counter() - started) * 1000:.0f} мс")
+        value = getattr(self._module, attr)
+        setattr(self, attr, value)
+        return value
+
+
+np = _LazyModule("numpy")
+go = _LazyModule("plotly.graph_objects")
+pio = _LazyModule("plotly.io")
+speedtest = _LazyModule("speedtest")
+_skyfield = _LazyModule("skyfield.api")
+_sgp4lib = _LazyModule("skyfield.sgp4lib")
+_sgp4 = _LazyModule("sgp4.api")
+_telegraph = _LazyModule("telegraph")
+
+_TLE_URL = "https://celestrak.org/NORAD/elements/gp.php?GROUP=starlink&FORMAT=tle"
+_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "StarlinkTracker")
+_WGS84_A_KM = 6378.137
+_WGS84_E2 = 6.69437999014e-3
+_WGS72_MU = 398600.8
+_WGS72_RADIUS_KM = 6378.135
+_UNIX_EPOCH_DAYS = 7306.0  # 1970-01-01 в днях от 1949-12-31, начала отсчёта epoch в элементах
+_ELEMENTS = [
+    ("satnum", "i4"),
+    ("epoch", "f8"),
+    ("ndot", "f8"),
+    ("nddot", "f8"),
+    ("bstar", "f8"),
+    ("inclo", "f8"),
+    ("nodeo", "f8"),
+    ("ecco", "f8"),
+    ("argpo", "f8"),
+    ("mo", "f8"),
+    ("no_kozai", "f8"),
+    ("elnum", "i4"),
+    ("revnum", "i4"),
+    ("intldesg", "S8"),
+]
+
+_COUNTRIES = [
+    ("Афганистан", 65, 33),
+    ("Албания", 20, 41),
+    ("Алжир", 3, 28),
+    ("Андорра", 1.5, 42.5),
+    ("Ангола", 17, -12),
+    ("Антигуа и Барбуда", -61.8, 17),
+    ("Аргентина", -65, -35),
+    ("Армения", 45, 40),
+    ("Австралия", 135, -25),
+    ("Австрия", 13, 47),
+    ("Азербайджан", 47, 40),
+    ("Багамы", -77, 24),
+    ("Бахрейн", 50.5, 26),
+    ("Бангладеш", 90, 24),
+    ("Барбадос", -59.5, 13),
+    ("Беларусь", 28, 53),
+    ("Бельгия", 4, 50.5),
+    ("Белиз", -88.5, 17.5),
+    ("Бенин", 2.5, 9.5),
+    ("Бутан", 90.5, 27.5),
+    ("Боливия", -65, -17),
+    ("Босния и Герцеговина", 18, 44),
+    ("Ботсвана", 24, -22),
+    ("Бразилия", -50, -10),
+    ("Бруней", 114.5, 4.5),
+    ("Болгария", 25, 43),
+    ("Буркина-Фасо", -2, 12),
+    ("Бурунди", 30, -3.5),
+    ("Кабо-Верде", -24, 16),
+    ("Камбоджа", 105, 13),
+    ("Камерун", 12, 6),
+    ("Канада", -100, 60),
+    ("ЦАР", 21, 7),
+    ("Чад", 19, 15),
+    ("Чили", -70, -30),
+    ("Китай", 100, 35),
+    ("Колумбия", -74, 4),
+    ("Коморы", 44, -12),
+    ("Конго (ДРК)", 25, 0),
+    ("Конго (Республика)", 15, -1),
+    ("Коста-Рика", -84, 10),
+    ("Хорватия", 16, 45),
+    ("Куба", -80, 22),
+    ("Кипр", 33, 35),
+    ("Чехия", 15, 50),
+    ("Дания", 10, 56),
+    ("Джибути", 43, 11),
+    ("Доминика", -61.3, 15.5),
+    ("Доминиканская Республика", -70, 19),
+    ("Эквадор", -78, -2),
+    ("Египет", 30, 26),
+    ("Сальвадор", -89, 13.5),
+    ("Экваториальная Гвинея", 10, 1),
+    ("Эритрея", 39, 15),
+    ("Эстония", 26, 58),
+    ("Эсватини", 31.5, -26.5),
+    ("Эфиопия", 40, 9),
+    ("Фиджи", 178, -18),
+    ("Финляндия", 25, 64),
+    ("Франция", 0, 46),
+    ("Габон", 11.5, -1),
+    ("Гамбия", -16.5, 13.5),
+    ("Грузия", 43.5, 42),
+    ("Германия", 10, 50),
+    ("Гана", -1, 8),
+    ("Греция", 22, 39),
+    ("Гренада", -61.7, 12),
+    ("Гватемала", -90.5, 15.5),
+    ("Гвинея", -11, 10),
+    ("Гвинея-Бисау", -15, 12),
+    ("Гайана", -59, 5),
+    ("Гаити", -72.5, 19),
+    ("Гондурас", -87.5, 15),
+    ("Венгрия", 19, 47),
+    ("Исландия", -18, 64),
+    ("Индия", 80, 20),
+    ("Индонезия", 120, -5),
+    ("Иран", 53, 32),
+    ("Ирак", 44, 33),
+    ("Ирландия", -8, 53),
+    ("Израиль", 34.5, 31.5),
+    ("Италия", 12, 42),
+    ("Ямайка", -77.5, 18),
+    ("Япония", 140, 35),
+    ("Иордания", 36, 31),
+    ("Казахстан", 68, 48),
+    ("Кения", 37, -1),
+    ("Кирибати", 172.5, 1.5),
+    ("Кувейт", 47.5, 29.5),
+    ("Киргизия", 75, 41),
+    ("Лаос", 103, 18),
+    ("Латвия", 24, 57),
+    ("Ливан", 35.5, 33.5),
+    ("Лесото", 28, -29.5),
+    ("Либерия", -9.5, 6.5),
+    ("Ливия", 17, 27),
+    ("Лихтенштейн", 9.5, 47),
+    ("Литва", 24, 55),
+    ("Люксембург", 6, 49.5),
+    ("Мадагаскар", 47, -20),
+    ("Малави", 34, -13.5),
+    ("Малайзия", 112, 3),
+    ("Мальдивы", 73, 3.5),
+    ("Мали", -4, 17),
+    ("Мальта", 14.5, 35.9),
+    ("Маршалловы Острова", 171, 7),
+    ("Мавритания", -12, 20),
+    ("Маврикий", 57.5, -20),
+    ("Мексика", -100, 25),
+    ("Микронезия", 158, 6.5),
+    ("Молдова", 29, 47),
+    ("Монако", 7.4, 43.7),
+    ("Монголия", 105, 46),
+    ("Черногория", 19, 42),
+    ("Марокко", -6, 32),
+    ("Мозамбик", 35, -18.5),
+    ("Мьянма", 96, 21),
+    ("Намибия", 17, -22),
+    ("Науру", 166.9, -0.5),
+    ("Непал", 84, 28),
+    ("Нидерланды", 5.5, 52),
+    ("Новая Зеландия", 175, -40),
+    ("Никарагуа", -85.5, 13),
+    ("Нигер", 8, 16),
+    ("Нигерия", 8, 10),
+    ("Северная Корея", 126, 40),
+    ("Северная Македония", 21.5, 41.5),
+    ("Норвегия", 10, 60),
+    ("Оман", 56, 21),
+    ("Пакистан", 70, 30),
+    ("Палау", 134.5, 7.5),
+    ("Панама", -80, 9),
+    ("Папуа — Новая Гвинея", 147, -6),
+    ("Парагвай", -58, -23),
+    ("Перу", -75, -10),
+    ("Филиппины", 122, 14),
+    ("Польша", 20, 52),
+    ("Португалия", -8, 39.5),
+    ("Катар", 51.5, 25.5),
+    ("Румыния", 25, 46),
+    ("Россия", 100, 60),
+    ("Руанда", 30, -2),
+    ("Сент-Китс и Невис", -62.7, 17.3),
+    ("Сент-Люсия", -61, 13.8),
+    ("Сент-Винсент и Гренадины", -61.2, 13.2),
+    ("Самоа", -172, -13.5),
+    ("Сан-Марино", 12.4, 43.9),
+    ("Сан-Томе и Принсипи", 7, 1),
+    ("Саудовская Аравия", 45, 24),
+    ("Сенегал", -14.5, 14.5),
+    ("Сербия", 20.5, 44),
+    ("Сейшелы", 55.5, -4.5),
+    ("Сьерра-Леоне", -11.5, 8.5),
+    ("Сингапур", 103.8, 1.3),
+    ("Словакия", 19.5, 48.5),
+    ("Словения", 15, 46),
+    ("Соломоновы Острова", 160, -9),
+    ("Сомали", 49, 5),
+    ("Южная Африка", 25, -30),
+    ("Южная Корея", 127, 36),
+    ("Южный Судан", 31, 7),
+    ("Испания", -4, 40),
+    ("Шри-Ланка", 81, 7),
+    ("Судан", 30, 15),
+    ("Суринам", -56, 4),
+    ("Швеция", 15, 64),
+    ("Швейцария", 8, 47),
+    ("Сирия", 38, 35),
+    ("Тайвань", 121, 23.5),
+    ("Таджикистан", 71, 39),
+    ("Танзания", 35, -6),
+    ("Таиланд", 100, 15),
+    ("Восточный Тимор", 125.5, -8.5),
+    ("Того", 1.2, 8),
+    ("Тонга", -175, -20),
+    ("Тринидад и Тобаго", -61.5, 10.5),
+    ("Тунис", 9, 34),
+    ("Турция", 35, 39),
+    ("Туркменистан", 60, 38),
+    ("Тувалу", 179, -8),
+    ("Уганда", 32, 1),
+    ("Украина", 30, 50),
+    ("ОАЭ", 54, 24),
+    ("Великобритания", -2, 54),
+    ("США", -100, 40),
+    ("Уругвай", -56, -33),
+    ("Узбекистан", 64, 41),
+    ("Вануату", 167, -15),
+    ("Ватикан", 12.45, 41.9),
+    ("Венесуэла", -66, 8),
+    ("Вьетнам", 108, 16),
+    ("Йемен", 48, 15),
+    ("Замбия", 28, -15),
+    ("Зимбабве", 30, -20)
+]
+
 
 @loader.tds
 class StarlinkTrackerMod(loader.Module):
@@ -33,12 +299,22 @@ class StarlinkTrackerMod(loader.Module):
             "📍 <b>Долгота:</b> {longitude:.2f}°\n"
             "📏 <b>Высота:</b> {altitude:.1f} км"
         ),
+        "track": (
+            "🛰️ <b>Трассы спутников Starlink на {minutes} мин</b>\n\n"
+            "{positions}"
+        ),
+        "track_usage": "Использование: .starlinktrack <имя>[, <имя>...] [минуты, до 360]",
         "near_sat": (
             "🛰️ <b>Ближайший спутник к {name}</b>\n\n"
             "📛 <b>Имя:</b> {near_name}\n"
             "📍 <b>Широта:</b> {latitude:.2f}°\n"
             "📍 <b>Долгота:</b> {longitude:.2f}°\n"
-            "📏 <b>Высота:</b> {altitude:.1f} км"
+            "📏 <b>Высота:</b> {altitude:.1f} км\n"
+            "📐 <b>Расстояние:</b> {distance:.0f} км"
+        ),
+        "near_sats": (
+            "🛰️ <b>Ближайшие спутники к {name} ({count})</b>\n\n"
+            "{positions}"
         ),
         "speed_result": (
             "🌐 <b>Оценка скорости интернета через Starlink</b>\n\n"
@@ -47,20 +323,153 @@ class StarlinkTrackerMod(loader.Module):
             "📤 <b>Скорость отдачи:</b> {upload:.2f} Мбит/с\n"
             "📍 <b>Ближайший спутник:</b> {sat_name} (высота {altitude:.1f} км)"
         ),
+        "passes": (
+            "🛰️ <b>Пролёты Starlink над {lat:.2f}°, {lon:.2f}°</b>\n"
+            "⏱ <b>Период:</b> {hours} ч, не ниже {min_el}° над горизонтом\n"
+            "📊 <b>Всего пролётов:</b> {count}\n\n"
+            "{passes}"
+        ),
+        "more_passes": "\n…и ещё {count}",
+        "no_passes": "😢 <b>Пролётов выше {min_el}° за {hours} ч не найдено</b>",
+        "passes_usage": "Укажите координаты: .starlinkpasses <широта> <долгота> [часы, до 24] [мин. угол]",
+        "passes_processing": "🔄 <b>Расчёт пролётов Starlink...</b>",
+        "visible": (
+            "🔭 <b>Спутники Starlink над {lat:.2f}°, {lon:.2f}° ({count})</b>\n"
+            "📐 Не ниже {min_el}° над горизонтом, по убыванию высоты\n\n"
+            "{positions}"
+        ),
+        "no_visible": "😢 <b>Сейчас над точкой нет спутников выше {min_el}°</b>",
+        "visible_usage": "Укажите координаты: .starlinkvisible <широта> <долгота> [мин. угол]",
+        "conjunctions": (
+            "⚠️ <b>Сближения спутников Starlink</b>\n"
+            "📏 <b>Порог:</b> {threshold} км, <b>окно:</b> {minutes} мин\n"
+            "📊 <b>Найдено:</b> {count}\n\n"
+            "{pairs}"
+        ),
+        "no_conjunctions": "✅ <b>Сближений ближе {threshold} км за {minutes} мин не найдено</b>",
+        "conj_usage": "Использование: .starlinkconj [порог, км, до 20] [минуты, до 120]",
+        "conj_processing": "🔄 <b>Поиск сближений спутников Starlink...</b>",
         "error": "❌ <b>Ошибка:</b> {}",
+        "stats": (
+            "📊 <b>Группировка Starlink: {count} спутников</b>\n\n"
+            "📏 <b>Высота орбиты:</b>\n{altitudes}\n\n"
+            "📐 <b>Наклонение:</b>\n{inclinations}\n\n"
+            "🚀 <b>Запуски ({launches}):</b>\n{cohorts}\n\n"
+            "🕓 <b>Возраст элементов (медиана {median_age:.1f} сут):</b>\n{ages}\n\n"
+            "⏱ <b>Расчёт:</b> {elapsed:.1f} мс"
+        ),
         "processing": "🔄 <b>Запрос данных Starlink...</b>",
         "speed_processing": "🔄 <b>Измерение скорости интернета...</b>",
         "no_data": "😢 <b>Данные о спутниках Starlink недоступны</b>",
-        "not_found": "😢 <b>Спутник {name} не найден</b>"
+        "not_found": "😢 <b>Спутник {name} не найден</b>",
+        "suggest": "\n\n💡 <b>Возможно, вы имели в виду:</b> {candidates}",
+        "ambiguous": "🔎 <b>Под «{name}» подходят {count} спутников:</b> {candidates}"
     }
 
+    def __init__(self):
+        self.config = loader.ModuleConfig(
+            loader.ConfigValue(
+                "tle_ttl",
+                7200,
+                "Через сколько секунд данные TLE считаются устаревшими и обновляются в фоне",
+                validator=loader.validators.Integer(minimum=60)
+            ),
+            loader.ConfigValue(
+                "ephemeris_step",
+                30,
+                "Шаг сетки эфемерид в секундах: положения между узлами интерполируются",
+                validator=loader.validators.Integer(minimum=5, maximum=300)
+            ),
+            loader.ConfigValue(
+                "ephemeris_span",
+                3600,
+                "На сколько секунд вперёд заранее рассчитываются положения спутников",
+                validator=loader.validators.Integer(minimum=300, maximum=86400)
+            ),
+            loader.ConfigValue(
+                "density_threshold",
+                300,
+                "Начиная с какого числа спутников карта рисуется как плотность, а не отдельными метками",
+                validator=loader.validators.Integer(minimum=1)
+            ),
+            loader.ConfigValue(
+                "speed_timeout",
+                90,
+                "Лимит времени на замер скорости интернета (секунды)",
+                validator=loader.validators.Integer(minimum=10)
+            ),
+            loader.ConfigValue(
+                "speed_cache_ttl",
+                600,
+                "Сколько секунд повторно использовать результат замера скорости",
+                validator=loader.validators.Integer(minimum=0)
+            ),
+            loader.ConfigValue(
+                "render_workers",
+                1,
+                "Количество процессов для отрисовки карт",
+                validator=loader.validators.Integer(minimum=1, maximum=4)
+            ),
+            loader.ConfigValue(
+                "render_queue",
+                4,
+                "Сколько карт может ждать отрисовки одновременно, остальные запросы отклоняются",
+                validator=loader.validators.Integer(minimum=1)
+            ),
+            loader.ConfigValue(
+                "render_timeout",
+                60,
+                "Лимит времени на отрисовку одной карты (секунды)",
+                validator=loader.validators.Integer(minimum=5)
+            ),
+        )
+        self._tle = None
+        self._tle_refresh = None
+        self._tle_attempt = 0
+        self._ephemeris = None
+        self._ephemeris_task = None
+        self._speed_result = None
+        self._speed_task = None
+        self._base_map = None
+        self._render_pool = None
+        self._render_slots = None
+        self._render_jobs = 0
+        self._warmup = None
+        self._ts = None
+        self._telegraph = None
+        self._pages = {}
+
     async def client_ready(self, client, db):
         self._client = client
         self._db = db
         self.session = aiohttp.ClientSession()
-        self.ts = load.timescale()
-        self.telegraph = Telegraph()
-        self.telegraph.create_account(short_name='StarlinkTracker')
+        logger.info(f"StarlinkTracker загружен за {(time.perf_counter() - _IMPORT_STARTED) * 1000:.0f} мс")
+
+    def _get_timescale(self):
+        """Шкала времени skyfield на встроенных в пакет таблицах, без загрузки файлов из сети"""
+        if self._ts is None:
+            self._ts = _skyfield.load.timescale(builtin=True)
+        return self._ts
+
+    async def _get_telegraph(self):
+        """Аккаунт Telegraph создаётся при первой публикации, токен сохраняется в базе.
+
+        Одновременные публикации ждут одно создание аккаунта."""
+        if self._telegraph is None:
+            self._telegraph = asyncio.ensure_future(self._open_telegraph())
+        try:
+            return await asyncio.shield(self._telegraph)
+        except Exception:
+            self._telegraph = None
+            raise
+
+    async def _open_telegraph(self):
+        token = self._db.get(__name__, "telegraph_token", None)
+        telegraph = _telegraph.Telegraph(token)
+        if not token:
+            await utils.run_sync(telegraph.create_account, short_name="StarlinkTracker")
+            self._db.set(__name__, "telegraph_token", telegraph.get_access_token())
+        return telegraph
 
     @loader.command(ru_doc="Показать положение спутников Starlink на карте Земли [число спутников]. Показывает до 5000 спутников, по умолчанию 100. Выводит карту и координаты ближайших 5 спутников, полный список в Telegraph.")
     async def starlink(self, message: Message):
@@ -72,47 +481,43 @@ class StarlinkTrackerMod(loader.Module):
             limit = 100
 
         await utils.answer(message, self.strings["processing"])
+        self._prepare_renderer()
         try:
-            satellites = await self._get_starlink_tle()
-            if not satellites:
+            catalogue = await self._get_starlink_tle()
+            if not catalogue:
                 return await utils.answer(message, self.strings["no_data"])
 
-            positions = []
-            for name, line1, line2 in satellites[:limit]:
-                sat = EarthSatellite(line1, line2, name, self.ts)
-                t = self.ts.now()
-                geocentric = sat.at(t)
-                subpoint = geocentric.subpoint()
-                positions.append({
-                    "name": name,
-                    "latitude": subpoint.latitude.degrees,
-                    "longitude": subpoint.longitude.degrees,
-                    "altitude": subpoint.elevation.km
-                })
+            # Момент округляется до минуты: одинаковые запросы в пределах минуты дают тот же список
+            # и переиспользуют уже опубликованную страницу Telegraph
+            moment = int(time.time() // 60 * 60)
+            positions = self._get_positions(catalogue, self._utc_moment(moment))
+            positions = self._select(positions, ~np.isnan(positions["altitude"]))
+            positions = self._select(positions, slice(0, limit))
 
-            text_positions_short = "\n".join(
-                f"📛 {pos['name']}: Широта {pos['latitude']:.2f}°, Долгота {pos['longitude']:.2f}°, Высота {pos['altitude']:.1f} км"
-                for pos in positions[:5]
-            )
-            text_positions_full = "\n".join(
-                f"📛 {pos['name']}: Широта {pos['latitude']:.2f}°, Долгота {pos['longitude']:.2f}°, Высота {pos['altitude']:.1f} км"
-                for pos in positions
-            )
+            count = len(positions["name"])
+            lines = [
+                f"📛 {name}: Широта {lat:.2f}°, Долгота {lon:.2f}°, Высота {alt:.1f} км"
+                for name, lat, lon, alt in zip(
+                    positions["name"], positions["latitude"], positions["longitude"], positions["altitude"]
+                )
+            ]
+            text_positions_short = "\n".join(lines[:5])
+            text_positions_full = "\n".join(lines)
 
             map_img = await self._generate_map(positions)
 
             telegraph_url = ""
             if len(text_positions_full) > 4096:
-                response = self.telegraph.create_page(
-                    title=f"Starlink Satellites ({len(positions)})",
-                    content=[{"tag": "p", "children": [text_positions_full.replace("\n", "<br>")]}]
+                telegraph_url = await self._publish_positions(
+                    (catalogue["key"], limit, moment),
+                    f"Starlink Satellites ({count}), {time.strftime('%d.%m %H:%M', time.gmtime(moment))} UTC",
+                    lines
                 )
-                telegraph_url = f"https://telegra.ph/{response['path']}"
             else:
                 await self._client.send_message(
                     message.chat_id,
                     self.strings["full_list"].format(
-                        count=len(positions),
+                        count=count,
                         positions=text_positions_full
                     )
                 )
@@ -121,7 +526,7 @@ class StarlinkTrackerMod(loader.Module):
                 message.chat_id,
                 map_img,
                 caption=self.strings["all_sats"].format(
-                    count=len(positions),
+                    count=count,
                     positions=text_positions_short,
                     telegraph_url=telegraph_url or "в следующем сообщении"
                 )
@@ -138,115 +543,95 @@ class StarlinkTrackerMod(loader.Module):
             return await utils.answer(message, self.strings["error"].format("Укажите имя спутника"))
 
         await utils.answer(message, self.strings["processing"])
+        self._prepare_renderer()
         try:
-            satellites = await self._get_starlink_tle()
-            if not satellites:
+            catalogue = await self._get_starlink_tle()
+            if not catalogue:
                 return await utils.answer(message, self.strings["no_data"])
 
-            target_sat = None
-            for sat_name, line1, line2 in satellites:
-                if sat_name.lower() == name.lower():
-                    target_sat = (sat_name, line1, line2)
-                    break
+            target, candidates = self._find_satellite(name)
+            if target is None:
+                return await utils.answer(message, self._not_found_text(name, candidates))
 
-            if not target_sat:
-                return await utils.answer(message, self.strings["not_found"].format(name=name))
+            position = self._select(self._get_positions(catalogue), [target])
 
-            sat = EarthSatellite(target_sat[1], target_sat[2], target_sat[0], self.ts)
-            t = self.ts.now()
-            geocentric = sat.at(t)
-            subpoint = geocentric.subpoint()
-            position = {
-                "name": target_sat[0],
-                "latitude": subpoint.latitude.degrees,
-                "longitude": subpoint.longitude.degrees,
-                "altitude": subpoint.elevation.km
-            }
-
-            map_img = await self._generate_map([position])
+            map_img = await self._generate_map(position)
 
             await self._client.send_file(
                 message.chat_id,
                 map_img,
                 caption=self.strings["one_sat"].format(
-                    name=position["name"],
-                    latitude=position["latitude"],
-                    longitude=position["longitude"],
-                    altitude=position["altitude"]
+                    name=position["name"][0],
+                    latitude=position["latitude"][0],
+                    longitude=position["longitude"][0],
+                    altitude=position["altitude"][0]
                 )
             )
             await message.delete()
 
-        except Exceptionbuster as e:
+        except Exception as e:
             await utils.answer(message, self.strings["error"].format(str(e)))
 
-    @loader.command(ru_doc="Показать ближайший спутник к указанному по имени. Выводит карту и координаты ближайшего спутника к указанному.")
+    @loader.command(ru_doc="Показать ближайшие спутники к указанному по имени [количество]. Выводит карту и координаты ближайших спутников, по умолчанию одного, до 20.")
     async def starlinknear(self, message: Message):
         name = utils.get_args_raw(message)
         if not name:
             return await utils.answer(message, self.strings["error"].format("Укажите имя спутника"))
 
+        count = 1
+        parts = name.rsplit(maxsplit=1)
+        if len(parts) == 2 and parts[1].isdigit():
+            name, count = parts[0], min(max(int(parts[1]), 1), 20)
+
         await utils.answer(message, self.strings["processing"])
+        self._prepare_renderer()
         try:
-            satellites = await self._get_starlink_tle()
-            if not satellites:
+            catalogue = await self._get_starlink_tle()
+            if not catalogue:
                 return await utils.answer(message, self.strings["no_data"])
 
-            target_sat = None
-            for sat_name, line1, line2 in satellites:
-                if sat_name.lower() == name.lower():
-                    target_sat = (sat_name, line1, line2)
-                    break
+            target, candidates = self._find_satellite(name)
+            if target is None:
+                return await utils.answer(message, self._not_found_text(name, candidates))
 
-            if not target_sat:
+            positions = self._get_positions(catalogue)
+            if np.isnan(positions["altitude"][target]):
                 return await utils.answer(message, self.strings["not_found"].format(name=name))
 
-            target = EarthSatellite(target_sat[1], target_sat[2], target_sat[0], self.ts)
-            t = self.ts.now()
-            target_geo = target.at(t)
-            target_sub = target_geo.subpoint()
-            target_lat = target_sub.latitude.degrees
-            target_lon = target_sub.longitude.degrees
-
-            min_distance = float("inf")
-            nearest_sat = None
-            nearest_pos = None
-
-            for name, line1, line2 in satellites:
-                if name == target_sat[0]:
-                    continue
-                sat = EarthSatellite(line1, line2, name, self.ts)
-                geo = sat.at(t)
-                sub = geo.subpoint()
-                lat = sub.latitude.degrees
-                lon = sub.longitude.degrees
-                distance = np.sqrt((target_lat - lat)**2 + (target_lon - lon)**2)
-                if distance < min_distance:
-                    min_distance = distance
-                    nearest_sat = name
-                    nearest_pos = {
-                        "name": name,
-                        "latitude": lat,
-                        "longitude": lon,
-                        "altitude": sub.elevation.km
-                    }
-
-            if not nearest_pos:
+            index = self._build_index(positions["xyz"])
+            ids, distances = self._query_nearest(index, positions["xyz"][target], count + 1)
+            keep = ids != target
+            ids, distances = ids[keep][:count], distances[keep][:count]
+            if not len(ids):
                 return await utils.answer(message, self.strings["not_found"].format(name="ближайший спутник"))
 
-            map_img = await self._generate_map([nearest_pos])
+            nearest_pos = self._select(positions, ids)
 
-            await self._client.send_file(
-                message.chat_id,
-                map_img,
-                caption=self.strings["near_sat"].format(
-                    name=target_sat[0],
-                    near_name=nearest_pos["name"],
-                    latitude=nearest_pos["latitude"],
-                    longitude=nearest_pos["longitude"],
-                    altitude=nearest_pos["altitude"]
+            map_img = await self._generate_map(nearest_pos)
+
+            if count == 1:
+                caption = self.strings["near_sat"].format(
+                    name=positions["name"][target],
+                    near_name=nearest_pos["name"][0],
+                    latitude=nearest_pos["latitude"][0],
+                    longitude=nearest_pos["longitude"][0],
+                    altitude=nearest_pos["altitude"][0],
+                    distance=distances[0]
                 )
-            )
+            else:
+                caption = self.strings["near_sats"].format(
+                    name=positions["name"][target],
+                    count=len(ids),
+                    positions="\n".join(
+                        f"📛 {sat_name}: {distance:.0f} км, Широта {lat:.2f}°, Долгота {lon:.2f}°, Высота {alt:.1f} км"
+                        for sat_name, distance, lat, lon, alt in zip(
+                            nearest_pos["name"], distances, nearest_pos["latitude"],
+                            nearest_pos["longitude"], nearest_pos["altitude"]
+                        )
+                    )
+                )
+
+            await self._client.send_file(message.chat_id, map_img, caption=caption)
             await message.delete()
 
         except Exception as e:
@@ -256,32 +641,16 @@ class StarlinkTrackerMod(loader.Module):
     async def starlinkspeed(self, message: Message):
         await utils.answer(message, self.strings["speed_processing"])
         try:
-            satellites = await self._get_starlink_tle()
-            if not satellites:
+            catalogue = await self._get_starlink_tle()
+            if not catalogue:
                 return await utils.answer(message, self.strings["no_data"])
 
-            st = speedtest.Speedtest()
-            st.get_best_server()
-            ping = st.results.ping
-            download = st.download() / 1_000_000
-            upload = st.upload() / 1_000_000
-
-            positions = []
-            for name, line1, line2 in satellites:
-                sat = EarthSatellite(line1, line2, name, self.ts)
-                t = self.ts.now()
-                geocentric = sat.at(t)
-                subpoint = geocentric.subpoint()
-                positions.append({
-                    "name": name,
-                    "latitude": subpoint.latitude.degrees,
-                    "longitude": subpoint.longitude.degrees,
-                    "altitude": subpoint.elevation.km
-                })
+            ping, download, upload = await self._measure_speed()
 
-            nearest_sat = min(positions, key=lambda x: np.sqrt(x["altitude"]**2))
-            sat_altitude = nearest_sat["altitude"]
-            sat_name = nearest_sat["name"]
+            positions = self._get_positions(catalogue)
+            nearest = np.nanargmin(positions["altitude"])
+            sat_altitude = positions["altitude"][nearest]
+            sat_name = positions["name"][nearest]
 
             light_speed = 299792
             sat_ping = (2 * sat_altitude / light_speed) * 1000
@@ -305,268 +674,1278 @@ class StarlinkTrackerMod(loader.Module):
         except Exception as e:
             await utils.answer(message, self.strings["error"].format(str(e)))
 
+    @loader.command(ru_doc="<широта> <долгота> [часы] [мин. угол] - Пролёты спутников Starlink над точкой. По умолчанию на 12 часов вперёд (до 24) выше 10° над горизонтом.")
+    async def starlinkpasses(self, message: Message):
+        try:
+            lat, lon, args = self._parse_coordinates(message)
+            hours = min(int(args[0]), 24) if args else 12
+            min_el = float(args[1]) if len(args) > 1 else 10.0
+            if hours <= 0 or not 0 <= min_el < 90:
+                raise ValueError
+        except (IndexError, ValueError):
+            return await utils.answer(message, self.strings["error"].format(self.strings["passes_usage"]))
+
+        await utils.answer(message, self.strings["passes_processing"])
+        try:
+            catalogue = await self._get_starlink_tle()
+            if not catalogue:
+                return await utils.answer(message, self.strings["no_data"])
+
+            passes = await utils.run_sync(self._predict_passes, catalogue, lat, lon, hours, min_el)
+            count = len(passes["sat"])
+            if not count:
+                return await utils.answer(message, self.strings["no_passes"].format(min_el=f"{min_el:g}", hours=hours))
+
+            shown = slice(0, 20)
+            rise = self._get_timescale().tt_jd(passes["rise"][shown]).utc_strftime("%d.%m %H:%M:%S")
+            peak = self._get_timescale().tt_jd(passes["peak"][shown]).utc_strftime("%H:%M:%S")
+            end = self._get_timescale().tt_jd(passes["set"][shown]).utc_strftime("%H:%M:%S")
+            text = self.strings["passes"].format(
+                lat=lat,
+                lon=lon,
+                hours=hours,
+                min_el=f"{min_el:g}",
+                count=count,
+                passes="\n".join(
+                    f"📛 {catalogue['names'][sat]}: {start} → {stop} UTC, макс. {elevation:.0f}° в {top}"
+                    for sat, start, top, stop, elevation in zip(
+                        passes["sat"][shown], rise, peak, end, passes["max_elevation"][shown]
+                    )
+                )
+            )
+            if count > 20:
+                text += self.strings["more_passes"].format(count=count - 20)
+            await utils.answer(message, text)
+
+        except Exception as e:
+            await utils.answer(message, self.strings["error"].format(str(e)))
+
+    @loader.command(ru_doc="<широта> <долгота> [мин. угол] - Спутники Starlink, которые сейчас над горизонтом в указанной точке, по убыванию высоты.")
+    async def starlinkvisible(self, message: Message):
+        try:
+            lat, lon, args = self._parse_coordinates(message)
+            min_el = float(args[0]) if args else 0.0
+            if not 0 <= min_el < 90:
+                raise ValueError
+        except (IndexError, ValueError):
+            return await utils.answer(message, self.strings["error"].format(self.strings["visible_usage"]))
+
+        await utils.answer(message, self.strings["processing"])
+        try:
+            catalogue = await self._get_starlink_tle()
+            if not catalogue:
+                return await utils.answer(message, self.strings["no_data"])
+
+            visible = self._visible(self._get_positions(catalogue), lat, lon, min_el)
+            if not len(visible["name"]):
+                return await utils.answer(message, self.strings["no_visible"].format(min_el=f"{min_el:g}"))
+
+            await utils.answer(
+                message,
+                self.strings["visible"].format(
+                    lat=lat,
+                    lon=lon,
+                    min_el=f"{min_el:g}",
+                    count=len(visible["name"]),
+                    positions="\n".join(
+                        f"📛 {name}: {elevation:.0f}° над горизонтом, азимут {azimuth:.0f}°, {distance:.0f} км"
+                        for name, elevation, azimuth, distance in zip(
+                            visible["name"][:30], visible["elevation"], visible["azimuth"], visible["distance"]
+                        )
+                    )
+                )
+            )
+
+        except Exception as e:
+            await utils.answer(message, self.strings["error"].format(str(e)))
+
+    @loader.command(ru_doc="[порог, км] [минуты] - Найти пары спутников Starlink, сближающиеся ближе порога (по умолчанию 5 км, до 20) в ближайшие минуты (по умолчанию 60, до 120).")
+    async def starlinkconj(self, message: Message):
+        args = utils.get_args_raw(message).split()
+        try:
+            threshold = float(args[0]) if args else 5.0
+            minutes = int(args[1]) if len(args) > 1 else 60
+            # Время поиска растёт с окном и порогом: пределы держат его в несколько секунд на всём каталоге
+            if not (0 < threshold <= 20 and 0 < minutes <= 120):
+                raise ValueError
+        except ValueError:
+            return await utils.answer(message, self.strings["error"].format(self.strings["conj_usage"]))
+
+        await utils.answer(message, self.strings["conj_processing"])
+        try:
+            catalogue = await self._get_starlink_tle()
+            if not catalogue:
+                return await utils.answer(message, self.strings["no_data"])
+
+            events = await utils.run_sync(self._screen_conjunctions, catalogue, threshold, minutes)
+            count = len(events["distance"])
+            if not count:
+                return await utils.answer(
+                    message,
+                    self.strings["no_conjunctions"].format(threshold=f"{threshold:g}", minutes=minutes)
+                )
+
+            shown = slice(0, 25)
+            moments = self._get_timescale().tt_jd(events["time"][shown]).utc_strftime("%d.%m %H:%M:%S")
+            text = self.strings["conjunctions"].format(
+                threshold=f"{threshold:g}",
+                minutes=minutes,
+                count=count,
+                pairs="\n".join(
+                    f"📛 {catalogue['names'][a]} ↔ {catalogue['names'][b]}: {distance:.2f} км в {moment} UTC, "
+                    f"{speed:.2f} км/с"
+                    for a, b, distance, moment, speed in zip(
+                        events["a"][shown], events["b"][shown], events["distance"][shown],
+                        moments, events["speed"][shown]
+                    )
+                )
+            )
+            if count > 25:
+                text += self.strings["more_passes"].format(count=count - 25)
+            await utils.answer(message, text)
+
+        except Exception as e:
+            await utils.answer(message, self.strings["error"].format(str(e)))
+
+    @loader.command(ru_doc="<имя>[, <имя>...] [минуты] - Трассы спутников Starlink на карте на ближайшие минуты (по умолчанию 90, до 360), до 10 спутников.")
+    async def starlinktrack(self, message: Message):
+        args = utils.get_args_raw(message).strip()
+        minutes = 90
+        parts = args.rsplit(maxsplit=1)
+        if len(parts) == 2 and parts[1].isdigit():
+            args, minutes = parts[0], int(parts[1])
+        queries = list(dict.fromkeys(query.strip() for query in args.split(",") if query.strip()))
+        if not queries or not 0 < minutes <= 360 or len(queries) > 10:
+            return await utils.answer(message, self.strings["error"].format(self.strings["track_usage"]))
+
+        await utils.answer(message, self.strings["processing"])
+        self._prepare_renderer()
+        try:
+            catalogue = await self._get_starlink_tle()
+            if not catalogue:
+                return await utils.answer(message, self.strings["no_data"])
+
+            targets = []
+            for query in queries:
+                target, candidates = self._find_satellite(query)
+                if target is None:
+                    return await utils.answer(message, self._not_found_text(query, candidates))
+                targets.append(target)
+
+            tracks = self._ground_tracks(catalogue, list(dict.fromkeys(targets)), minutes)
+            now = {key: value[:, 0] if key != "name" else value for key, value in tracks.items()}
+
+            map_img = await self._generate_map(now, tracks=tracks)
+
+            await self._client.send_file(
+                message.chat_id,
+                map_img,
+                caption=self.strings["track"].format(
+                    minutes=minutes,
+                    positions="\n".join(
+                        f"📛 {name}: {lat:.2f}°, {lon:.2f}°, {alt:.1f} км"
+                        for name, lat, lon, alt in zip(
+                            now["name"], now["latitude"], now["longitude"], now["altitude"]
+                        )
+                    )
+                )
+            )
+            await message.delete()
+
+        except Exception as e:
+            await utils.answer(message, self.strings["error"].format(str(e)))
+
+    @loader.command(ru_doc="Статистика группировки Starlink по элементам TLE: высоты орбит, наклонения, запуски по годам и свежесть элементов.")
+    async def starlinkstats(self, message: Message):
+        await utils.answer(message, self.strings["processing"])
+        try:
+            catalogue = await self._get_starlink_tle()
+            if not catalogue:
+                return await utils.answer(message, self.strings["no_data"])
+
+            started = time.perf_counter()
+            stats = self._constellation_stats(catalogue["elements"])
+            elapsed = (time.perf_counter() - started) * 1000
+
+            def rows(groups):
+                return "\n".join(f"• {label}: {count}" for label, count in groups)
+
+            await utils.answer(
+                message,
+                self.strings["stats"].format(
+                    count=len(catalogue["elements"]),
+                    altitudes=rows(stats["altitudes"]),
+                    inclinations=rows(stats["inclinations"]),
+                    launches=stats["launches"],
+                    cohorts=rows(stats["cohorts"]),
+                    median_age=stats["median_age"],
+                    ages=rows(stats["ages"]),
+                    elapsed=elapsed
+                )
+            )
+
+        except Exception as e:
+            await utils.answer(message, self.strings["error"].format(str(e)))
+
+    def _constellation_stats(self, elements, band=25, shells=8):
+        """Разбивка группировки по элементам TLE без пропагации.
+
+        Средняя высота берётся из полуоси по среднему движению, наклонения группируются
+        с точностью 0.1°, запуски - по международному обозначению, возраст - от эпохи элементов."""
+        n = elements["no_kozai"] / 60.0
+        altitude = np.cbrt(_WGS72_MU / np.where(n > 0, n * n, np.nan)) - _WGS72_RADIUS_KM
+        bands = np.floor(altitude[~np.isnan(altitude)] / band).astype(int) * band
+        values, counts = np.unique(bands, return_counts=True)
+        top = np.sort(np.argsort(-counts, kind="stable")[:shells])
+        altitudes = [(f"{value}–{value + band} км", count) for value, count in zip(values[top], counts[top])]
+        if len(values) > shells:
+            altitudes.append(("остальные", int(counts.sum() - counts[top].sum())))
+
+        values, counts = np.unique(np.round(np.degrees(elements["inclo"]), 1), return_counts=True)
+        top = np.sort(np.argsort(-counts, kind="stable")[:shells])
+        inclinations = [(f"{value:.1f}°", count) for value, count in zip(values[top], counts[top])]
+        if len(values) > shells:
+            inclinations.append(("остальные", int(counts.sum() - counts[top].sum())))
+
+        # Международное обозначение "19074A": год и номер запуска, буква - объект запуска
+        launch = elements["intldesg"].astype("S5")
+        year = launch.astype("S2")
+        year = year[year != b""]
+        years, counts = np.unique(year.astype(int), return_counts=True)
+        cohorts = [
+            (f"{value + (2000 if value < 57 else 1900)}", count) for value, count in zip(years, counts)
+        ]
+
+        age = np.maximum(time.time() / 86400.0 + _UNIX_EPOCH_DAYS - elements["epoch"], 0.0)
+        edges = [0, 1, 3, 7, 30]
+        counts = np.histogram(age, bins=edges + [np.inf])[0]
+        ages = [
+            (f"до {stop} сут" if not start else f"{start}–{stop} сут", count)
+            for start, stop, count in zip(edges, edges[1:], counts)
+        ] + [(f"больше {edges[-1]} сут", counts[-1])]
+
+        return {
+            "altitudes": altitudes,
+            "inclinations": inclinations,
+            "launches": len(np.unique(launch[launch != b""])),
+            "cohorts": cohorts,
+            "median_age": float(np.median(age)) if len(age) else 0.0,
+            "ages": ages,
+        }
+
+    async def _publish_positions(self, key, title, lines):
+        """Ссылка на список в Telegraph; повторный запрос с тем же ключом получает уже опубликованные страницы.
+
+        Ключ - (каталог, число спутников, момент), поэтому при обновлении TLE или смене минуты
+        старые ссылки вытесняются. Одновременные одинаковые запросы ждут одну публикацию."""
+        if key not in self._pages:
+            self._pages = {
+                cached: page for cached, page in self._pages.items()
+                if cached[0] == key[0] and cached[2] == key[2]
+            }
+            self._pages[key] = asyncio.ensure_future(self._publish_pages(title, lines))
+        try:
+            return await asyncio.shield(self._pages[key])
+        except Exception:
+            self._pages.pop(key, None)
+            raise
+
+    async def _publish_pages(self, title, lines):
+        telegraph = await self._get_telegraph()
+        return await utils.run_sync(self._create_pages, telegraph, title, lines)
+
+    def _create_pages(self, telegraph, title, lines, per_page=400):
+        """Публикует строки страницами по per_page строк, каждая страница ссылается на следующую.
+
+        Страницы создаются с конца, чтобы ссылка на следующую была известна; возвращает адрес первой."""
+        pages = [lines[start:start + per_page] for start in range(0, len(lines), per_page)]
+        url = None
+        for number in range(len(pages), 0, -1):
+            children = []
+            for line in pages[number - 1]:
+                children += [line, {"tag": "br"}]
+            content = [{"tag": "p", "children": children}]
+            if url:
+                content.append({
+                    "tag": "p",
+                    "children": [{"tag": "a", "attrs": {"href": url}, "children": [f"Страница {number + 1} из {len(pages)} →"]}]
+                })
+            response = telegraph.create_page(
+                title=title if len(pages) == 1 else f"{title} {number}/{len(pages)}",
+                content=content
+            )
+            url = f"https://telegra.ph/{response['path']}"
+        return url
+
+    def _parse_coordinates(self, message):
+        """Широта и долгота из первых аргументов команды и список остальных аргументов"""
+        args = utils.get_args_raw(message).replace(",", " ").split()
+        lat, lon = float(args[0]), float(args[1])
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError
+        return lat, lon, args[2:]
+
+    def _visible(self, positions, lat, lon, min_el):
+        """Спутники выше min_el над наблюдателем, по убыванию высоты над горизонтом.
+
+        Кандидаты берутся запросом по радиусу к пространственному индексу: дальше наклонной дальности
+        на угле min_el для самой высокой орбиты спутник не может быть виден. Точные высота и азимут
+        считаются только для них."""
+        observer, up = self._observer(lat, lon)
+        orbit = _WGS84_A_KM + np.nanmax(positions["altitude"])
+        sin_min = np.sin(np.radians(min_el))
+        reach = np.sqrt(orbit ** 2 - _WGS84_A_KM ** 2 * (1 - sin_min ** 2)) - _WGS84_A_KM * sin_min
+        ids, distances = self._query_radius(self._build_index(positions["xyz"]), observer, reach)
+
+        rho = positions["xyz"][ids] - observer
+        elevation = np.degrees(np.arcsin(rho @ up / distances))
+        lat_r, lon_r = np.radians(lat), np.radians(lon)
+        east = np.array([-np.sin(lon_r), np.cos(lon_r), 0.0])
+        north = np.array([-np.sin(lat_r) * np.cos(lon_r), -np.sin(lat_r) * np.sin(lon_r), np.cos(lat_r)])
+        azimuth = np.degrees(np.arctan2(rho @ east, rho @ north)) % 360
+
+        keep = elevation >= min_el
+        order = np.argsort(-elevation[keep])
+        return {
+            "name": positions["name"][ids][keep][order],
+            "elevation": elevation[keep][order],
+            "azimuth": azimuth[keep][order],
+            "distance": distances[keep][order],
+        }
+
+    async def _measure_speed(self):
+        """Пинг (мс), загрузка и отдача (Мбит/с). Недавний результат берётся из кеша, параллельные вызовы ждут один замер"""
+        if self._speed_result and time.time() - self._speed_result[0] < self.config["speed_cache_ttl"]:
+            return self._speed_result[1]
+        if self._speed_task is None or self._speed_task.done():
+            self._speed_task = asyncio.ensure_future(self._speed_job())
+        return await asyncio.shield(self._speed_task)
+
+    async def _speed_job(self):
+        stop = threading.Event()
+        try:
+            result = await asyncio.wait_for(utils.run_sync(self._run_speedtest, stop), self.config["speed_timeout"])
+        except asyncio.TimeoutError:
+            stop.set()
+            raise RuntimeError("Замер скорости не уложился в отведённое время")
+        except asyncio.CancelledError:
+            stop.set()
+            raise
+        self._speed_result = (time.time(), result)
+        return result
+
+    def _run_speedtest(self, stop):
+        st = speedtest.Speedtest(shutdown_event=stop)
+        st.get_best_server()
+        return st.results.ping, st.download() / 1_000_000, st.upload() / 1_000_000
+
     async def _get_starlink_tle(self):
-        url = "https://celestrak.org/NORAD/elements/gp.php?GROUP=starlink&FORMAT=tle"
-        async with self.session.get(url) as resp:
-            lines = (await resp.text()).strip().splitlines()
-            satellites = []
-            for i in range(0, len(lines), 3):
-                if i + 2 < len(lines):
-                    name = lines[i].strip()
-                    line1 = lines[i + 1].strip()
-                    line2 = lines[i + 2].strip()
-                    satellites.append((name, line1, line2))
-            return satellites
-
-    async def _generate_map(self, positions):
-        fig = go.Figure()
-
-        fig.add_trace(
+        """Каталог TLE из кеша. Устаревший кеш отдаётся сразу и обновляется в фоне"""
+        if self._tle is None:
+            self._tle = self._load_tle_cache()
+
+        now = time.time()
+        stale = self._tle is None or now - self._tle["fetched"] > self.config["tle_ttl"]
+        # После неудачной загрузки CelesTrak запрашивается снова не раньше паузы:
+        # частые повторные загрузки он блокирует по IP
+        retry = now - self._tle_attempt >= min(self.config["tle_ttl"], 900)
+        if stale and retry and (self._tle_refresh is None or self._tle_refresh.done()):
+            self._tle_attempt = now
+            self._tle_refresh = asyncio.ensure_future(self._refresh_tle())
+        if self._tle is None:
+            await asyncio.shield(self._tle_refresh)
+
+        return self._tle
+
+    async def _refresh_tle(self):
+        headers = {}
+        if self._tle:
+            if self._tle.get("etag"):
+                headers["If-None-Match"] = self._tle["etag"]
+            if self._tle.get("last_modified"):
+                headers["If-Modified-Since"] = self._tle["last_modified"]
+
+        try:
+            async with self.session.get(_TLE_URL, headers=headers) as resp:
+                if resp.status == 304 and self._tle:
+                    self._tle["fetched"] = time.time()
+                else:
+                    resp.raise_for_status()
+                    names, elements, satrec_list = await self._read_tle_stream(resp, self._tle)
+                    if not len(names):
+                        return
+                    previous = self._tle
+                    self._tle = self._make_catalogue(
+                        names,
+                        elements,
+                        previous=previous,
+                        satrec_list=satrec_list,
+                        fetched=time.time(),
+                        etag=resp.headers.get("ETag"),
+                        last_modified=resp.headers.get("Last-Modified"),
+                    )
+                    if previous is not None and (self._ephemeris_task is None or self._ephemeris_task.done()):
+                        self._ephemeris_task = asyncio.ensure_future(self._carry_ephemeris(previous, self._tle))
+            self._save_tle_cache()
+        except Exception as e:
+            if not self._tle:
+                raise
+            logger.warning(f"Не удалось обновить TLE Starlink, используется кеш: {e}")
+
+    async def _read_tle_stream(self, resp, previous=None, batch=1000):
+        """Разбирает ответ с TLE по мере загрузки, пачками по batch спутников.
+
+        В памяти одновременно только текущая пачка строк. Satrec для новых и изменившихся спутников
+        строятся сразу по приходе пачки, пока догружается остальное. Возвращает имена, элементы и Satrec."""
+        names, elements, satrec_list = [], [], []
+        lines, skipped = [], 0
+
+        def flush(lines):
+            nonlocal skipped
+            batch_names, batch_elements, rest, invalid = self._parse_lines(lines)
+            skipped += invalid
+            names.append(batch_names)
+            elements.append(batch_elements)
+            satrec_list.extend(self._build_satrecs(batch_elements, previous))
+            return rest
+
+        async for line in resp.content:
+            lines.append(line.rstrip())
+            if len(lines) >= batch * 3:
+                lines = flush(lines)
+                await asyncio.sleep(0)
+        flush(lines)
+
+        if skipped:
+            logger.warning(f"Пропущено {skipped} записей TLE с неверной контрольной суммой или несовпадающим номером")
+        return np.concatenate(names), np.concatenate(elements), satrec_list
+
+    def _parse_tle(self, text):
+        """Имена и структурированный массив элементов орбит (_ELEMENTS) из текста TLE"""
+        names, elements, _, _ = self._parse_lines([line.rstrip() for line in text.encode().splitlines()])
+        return names, elements
+
+    def _parse_lines(self, lines):
+        """Разбирает полные записи из списка строк (bytes), хвост незаконченной записи возвращается для следующей пачки.
+
+        Поля колонок фиксированной ширины разбираются векторно по всей пачке сразу,
+        единицы те же, что у Satrec.twoline2rv, поэтому Satrec строятся из строк массива.
+        Записи с неверной контрольной суммой или разными номерами в строках отбрасываются.
+        Возвращает (имена, элементы, хвост, число отброшенных записей)."""
+        names, first, second = [], [], []
+        name, line1, done = b"", None, 0
+        for number, line in enumerate(lines):
+            if line.startswith(b"1 ") and len(line) >= 69:
+                line1 = line
+            elif line.startswith(b"2 ") and len(line) >= 69 and line1 is not None:
+                names.append(name)
+                first.append(line1[:69])
+                second.append(line[:69])
+                name, line1, done = b"", None, number + 1
+            else:
+                name, line1 = line, None
+        if not first:
+            return np.array([], dtype=str), np.zeros(0, dtype=_ELEMENTS), lines[done:], 0
+
+        line1 = np.array(first, dtype="S69")
+        line2 = np.array(second, dtype="S69")
+        valid = (
+            self._checksum_ok(line1)
+            & self._checksum_ok(line2)
+            & (self._field(line1, 2, 7) == self._field(line2, 2, 7))
+        )
+        names = np.char.strip(np.char.decode(np.array(names, dtype=bytes)[valid], errors="replace"))
+        line1, line2 = line1[valid], line2[valid]
+        count = len(line1)
+
+        elements = np.zeros(count, dtype=_ELEMENTS)
+        if not count:
+            return names.astype(str), elements, lines[done:], int((~valid).sum())
+        year = self._field(line1, 18, 20).astype(int)
+        year = np.where(year < 57, 2000 + year, 1900 + year)
+        elements["satnum"] = self._satnums(self._field(line1, 2, 7))
+        elements["intldesg"] = np.char.strip(self._field(line1, 9, 17))
+        elements["epoch"] = (
+            (year - 1970).astype("datetime64[Y]").astype("datetime64[D]") - np.datetime64("1949-12-31")
+        ).astype(float) + self._field(line1, 20, 32).astype(float) - 1.0
+        elements["ndot"] = self._field(line1, 33, 43).astype(float) / (1440.0 * 1440.0 / (2 * np.pi))
+        elements["nddot"] = self._implied_decimal(self._field(line1, 44, 52)) / (1440.0 ** 3 / (2 * np.pi))
+        elements["bstar"] = self._implied_decimal(self._field(line1, 53, 61))
+        elements["elnum"] = self._field(line1, 64, 68).astype(int)
+        elements["inclo"] = np.radians(self._field(line2, 8, 16).astype(float))
+        elements["nodeo"] = np.radians(self._field(line2, 17, 25).astype(float))
+        elements["ecco"] = (b"0." + np.char.strip(self._field(line2, 26, 33))).astype(float)
+        elements["argpo"] = np.radians(self._field(line2, 34, 42).astype(float))
+        elements["mo"] = np.radians(self._field(line2, 43, 51).astype(float))
+        elements["no_kozai"] = self._field(line2, 52, 63).astype(float) * (2 * np.pi / 1440.0)
+        elements["revnum"] = self._field(line2, 63, 68).astype(int)
+        return names, elements, lines[done:], int((~valid).sum())
+
+    def _checksum_ok(self, lines):
+        """Контрольная сумма TLE: сумма цифр и минусов в первых 68 символах по модулю 10 равна 69-му"""
+        chars = lines.view("u1").reshape(len(lines), 69)
+        digits = chars[:, :68] - 48  # uint8: всё, что не цифра, уходит за 9
+        total = np.where(digits < 10, digits, 0).sum(axis=1) + (chars[:, :68] == 45).sum(axis=1)
+        return total % 10 == chars[:, 68] - 48
+
+    def _field(self, lines, start, stop):
+        """Колонки start:stop всех строк массива байтовых строк одинаковой ширины"""
+        chars = lines.view("S1").reshape(len(lines), -1)[:, start:stop]
+        return np.ascontiguousarray(chars).view(f"S{stop - start}").ravel()
+
+    def _implied_decimal(self, field):
+        """Поля вида ' 12345-3' с подразумеваемой точкой: 0.12345e-3"""
+        sign = np.where(self._field(field, 0, 1) == b"-", -1.0, 1.0)
+        return sign * self._field(field, 1, 6).astype(float) * 1e-5 * 10.0 ** self._field(field, 6, 8).astype(int)
+
+    def _satnums(self, field):
+        try:
+            return field.astype(int)
+        except ValueError:
+            # Alpha-5: первая буква заменяет две старшие цифры (A=10 ... Z=33 без I и O)
+            letters = "ABCDEFGHJKLMNPQRSTUVWXYZ"
+            return np.array([
+                int(value) if value[:1].isdigit() else (letters.index(value[0]) + 10) * 10000 + int(value[1:])
+                for value in np.char.decode(field).tolist()
+            ])
+
+    def _satrec(self, row):
+        """Satrec из строки массива элементов (кортеж в порядке полей _ELEMENTS)"""
+        satnum, epoch, ndot, nddot, bstar, inclo, nodeo, ecco, argpo, mo, no_kozai = row[:11]
+        sat = _sgp4.Satrec()
+        sat.sgp4init(_sgp4.WGS72, "i", satnum, epoch, bstar, ndot, nddot, ecco, argpo, inclo, mo, no_kozai, nodeo)
+        return sat
+
+    def _make_catalogue(self, names, elements, previous=None, satrec_list=None, **meta):
+        """Каталог: таблица имён, массив элементов, индекс поиска и пропагатор SGP4.
+
+        Если передан предыдущий каталог, Satrec и строки сетки эфемерид переносятся для спутников
+        с тем же номером NORAD и эпохой, заново строятся только изменившиеся и новые."""
+        catalogue = dict(
+            meta,
+            names=names,
+            elements=elements,
+            satrec_list=satrec_list,
+            satrecs=None,
+            key=hash(elements.tobytes()),
+            lookup=self._build_lookup(names, elements["satnum"]),
+        )
+        if previous is None or previous["satrec_list"] is None:
+            return catalogue
+
+        reused = self._match_elements(previous["elements"], elements)
+        if catalogue["satrec_list"] is None:
+            catalogue["satrec_list"] = self._build_satrecs(elements, previous, reused)
+        kept = int((reused >= 0).sum())
+        logger.info(
+            f"TLE Starlink обновлены: {len(elements) - kept} новых или изменённых, "
+            f"{len(previous['elements']) - kept} удалено, {kept} без изменений"
+        )
+        return catalogue
+
+    def _build_satrecs(self, elements, previous=None, reused=None):
+        """Satrec для строк elements; у спутников без изменений берутся из предыдущего каталога"""
+        if previous is None or previous["satrec_list"] is None:
+            return [self._satrec(row) for row in elements.tolist()]
+        if reused is None:
+            reused = self._match_elements(previous["elements"], elements)
+        return [
+            previous["satrec_list"][old] if old >= 0 else self._satrec(row)
+            for old, row in zip(reused.tolist(), elements.tolist())
+        ]
+
+    def _match_elements(self, old, new):
+        """Для каждой строки new - индекс строки old с тем же номером NORAD и эпохой, иначе -1"""
+        order = np.argsort(old["satnum"], kind="stable")
+        pos = np.searchsorted(old["satnum"], new["satnum"], sorter=order).clip(max=len(old) - 1)
+        match = order[pos]
+        same = (old["satnum"][match] == new["satnum"]) & (np.abs(old["epoch"][match] - new["epoch"]) < 1e-8)
+        return np.where(same, match, -1)
+
+    async def _carry_ephemeris(self, previous, catalogue):
+        """Переносит сетку эфемерид на новый каталог в фоне, досчитывая только изменившиеся спутники.
+
+        Запускается как задача сетки, поэтому пока она идёт, полная перестройка не планируется."""
+        grid = self._ephemeris
+        if not grid or grid["key"] != previous["key"]:
+            return
+        try:
+            carried = await utils.run_sync(self._carried_grid, grid, previous, catalogue)
+        except Exception as e:
+            logger.warning(f"Не удалось перенести сетку эфемерид Starlink: {e}")
+            return
+        if self._ephemeris is grid:
+            self._ephemeris = carried
+
+    def _carried_grid(self, grid, previous, catalogue, chunk=20):
+        reused = self._match_elements(previous["elements"], catalogue["elements"])
+        steps = grid["xyz"].shape[1]
+        xyz = np.empty((len(reused), steps, 3), dtype=np.float32)
+        xyz[reused >= 0] = grid["xyz"][reused[reused >= 0]]
+        changed = np.flatnonzero(reused < 0)
+        if len(changed):
+            satrecs = _sgp4.SatrecArray([catalogue["satrec_list"][i] for i in changed.tolist()])
+            # Блоками по chunk моментов, как и при построении сетки: SGP4 держит GIL
+            for first in range(0, steps, chunk):
+                offsets = np.arange(first, min(first + chunk, steps)) * grid["step"] / 86400.0
+                times = self._get_timescale().tt_jd(grid["start"] + offsets)
+                xyz[changed, first:first + len(offsets)] = self._sgp4_itrf(satrecs, times)
+        return dict(grid, key=catalogue["key"], xyz=xyz)
+
+    def _normalize_name(self, name):
+        return re.sub(r"[^0-9A-ZА-ЯЁ]", "", name.upper())
+
+    def _build_lookup(self, names, satnums):
+        """Индекс каталога: нормализованное имя и номер NORAD -> позиция, плюс отсортированные имена для поиска по префиксу"""
+        by_name, by_norad = {}, {}
+        for i, (name, satnum) in enumerate(zip(names.tolist(), satnums.tolist())):
+            by_name.setdefault(self._normalize_name(name), i)
+            by_norad.setdefault(str(satnum), i)
+        return {"by_name": by_name, "by_norad": by_norad, "names": sorted(by_name)}
+
+    def _find_satellite(self, query):
+        """Позиция спутника в каталоге по имени, номеру NORAD или однозначному префиксу имени.
+
+        Если спутник не найден, вторым значением возвращаются подходящие имена."""
+        lookup = self._tle["lookup"]
+        key = self._normalize_name(query)
+        if key in lookup["by_name"]:
+            return lookup["by_name"][key], []
+        if query.strip().isdigit() and query.strip().lstrip("0") in lookup["by_norad"]:
+            return lookup["by_norad"][query.strip().lstrip("0")], []
+
+        names = lookup["names"]
+        start = bisect.bisect_left(names, key)
+        stop = bisect.bisect_left(names, key + "\uffff", lo=start)
+        if key and stop - start == 1:
+            return lookup["by_name"][names[start]], []
+        if key and stop > start:
+            matches = names[start:stop]
+        else:
+            matches = difflib.get_close_matches(key, names, n=5, cutoff=0.75)
+
+        return None, [str(self._tle["names"][lookup["by_name"][match]]) for match in matches]
+
+    def _not_found_text(self, name, candidates):
+        if len(candidates) > 5:
+            return self.strings["ambiguous"].format(
+                name=name,
+                count=len(candidates),
+                candidates=", ".join(sorted(candidates, key=lambda x: (len(x), x))[:10])
+            )
+        text = self.strings["not_found"].format(name=name)
+        if candidates:
+            text += self.strings["suggest"].format(candidates=", ".join(candidates))
+        return text
+
+    def _load_tle_cache(self):
+        """Каталог с диска: массивы открываются через mmap, текст TLE не разбирается заново"""
+        try:
+            with open(os.path.join(_CACHE_DIR, "starlink.json")) as f:
+                meta = json.load(f)
+            names = np.load(os.path.join(_CACHE_DIR, "starlink-names.npy"), mmap_mode="r")
+            elements = np.load(os.path.join(_CACHE_DIR, "starlink-elements.npy"), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if not len(names) or elements.dtype != np.dtype(_ELEMENTS) or len(elements) != len(names):
+            return None
+        return self._make_catalogue(names, elements, **meta)
+
+    def _save_tle_cache(self):
+        try:
+            os.makedirs(_CACHE_DIR, exist_ok=True)
+            for name, array in (("names", self._tle["names"]), ("elements", self._tle["elements"])):
+                with open(os.path.join(_CACHE_DIR, f"starlink-{name}.npy.tmp"), "wb") as f:
+                    np.save(f, array)
+                os.replace(
+                    os.path.join(_CACHE_DIR, f"starlink-{name}.npy.tmp"),
+                    os.path.join(_CACHE_DIR, f"starlink-{name}.npy")
+                )
+            with open(os.path.join(_CACHE_DIR, "starlink.json"), "w") as f:
+                json.dump({key: self._tle.get(key) for key in ("fetched", "etag", "last_modified")}, f)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить кеш TLE Starlink: {e}")
+
+    def _get_propagator(self, catalogue):
+        if catalogue["satrecs"] is None:
+            if catalogue["satrec_list"] is None:
+                catalogue["satrec_list"] = [self._satrec(row) for row in catalogue["elements"].tolist()]
+            catalogue["satrecs"] = _sgp4.SatrecArray(catalogue["satrec_list"])
+        return catalogue["key"], catalogue["names"], catalogue["satrecs"]
+
+    def _propagate(self, catalogue, t):
+        """Положение всех спутников каталога на момент t одним вызовом SGP4.
+
+        Возвращает словарь колонок (numpy-массивы, выровненные по каталогу).
+        Если t - массив моментов, колонки имеют форму (спутники, моменты).
+        Спутники, для которых SGP4 вернул ошибку, получают NaN."""
+        _, names, _ = self._get_propagator(catalogue)
+        return self._positions(names, self._propagate_itrf(catalogue, t))
+
+    def _propagate_itrf(self, catalogue, t):
+        """ITRF-координаты (км) всех спутников каталога на момент или массив моментов t"""
+        return self._sgp4_itrf(self._get_propagator(catalogue)[2], t)
+
+    def _sgp4_teme(self, satrecs, t):
+        """Положения (км) и скорости (км/с) в TEME формы (спутники, моменты, 3); ошибки SGP4 дают NaN"""
+        jd = np.atleast_1d(t.whole)
+        fr = np.atleast_1d(t.tai_fraction - t._leap_seconds() / 86400.0)
+        error, r, v = satrecs.sgp4(jd, fr)
+        r[error != 0] = np.nan
+        v[error != 0] = np.nan
+        return r, v
+
+    def _sgp4_itrf(self, satrecs, t):
+        r, _ = self._sgp4_teme(satrecs, t)
+        jd = np.atleast_1d(t.whole)
+        theta, _ = _sgp4lib.theta_GMST1982(jd, np.atleast_1d(t.ut1_fraction))
+        cos_t, sin_t = np.cos(theta), np.sin(theta)
+        xyz = np.stack((
+            cos_t * r[..., 0] + sin_t * r[..., 1],
+            cos_t * r[..., 1] - sin_t * r[..., 0],
+            r[..., 2],
+        ), axis=-1)
+        return xyz[:, 0] if np.ndim(t.whole) == 0 else xyz
+
+    def _ground_tracks(self, catalogue, ids, minutes, step=30):
+        """Трассы выбранных спутников от текущего момента на minutes минут с шагом step секунд.
+
+        Все моменты считаются одним вызовом SGP4 по оси времени; колонки имеют форму (спутники, моменты)."""
+        self._get_propagator(catalogue)
+        start = self._get_timescale().now().tt
+        t = self._get_timescale().tt_jd(start + np.arange(0, minutes * 60 + 1, step) / 86400.0)
+        satrecs = _sgp4.SatrecArray([catalogue["satrec_list"][i] for i in ids])
+        return self._positions(catalogue["names"][ids], self._sgp4_itrf(satrecs, t))
+
+    def _positions(self, names, xyz):
+        lat, lon, alt = self._geodetic(xyz[..., 0], xyz[..., 1], xyz[..., 2])
+        return {"name": names, "latitude": lat, "longitude": lon, "altitude": alt, "xyz": xyz}
+
+    def _get_positions(self, catalogue, t=None):
+        """Положения спутников на момент t (по умолчанию сейчас).
+
+        Внутри окна сетки эфемерид это интерполяция по готовому массиву, иначе прямой расчёт SGP4,
+        после которого сетка на ближайший час строится в фоне."""
+        t = self._get_timescale().now() if t is None else t
+        key, names, _ = self._get_propagator(catalogue)
+        grid = self._ephemeris
+        if grid and grid["key"] == key:
+            offset = (t.tt - grid["start"]) * 86400.0 / grid["step"]
+            if 0 <= offset < grid["xyz"].shape[1] - 1:
+                if offset > (grid["xyz"].shape[1] - 1) * 0.8:
+                    self._schedule_ephemeris(catalogue)
+                return self._positions(names, self._interpolate(grid["xyz"], offset))
+
+        self._schedule_ephemeris(catalogue)
+        return self._propagate(catalogue, t)
+
+    def _interpolate(self, grid, offset):
+        """Линейная интерполяция между соседними узлами сетки с восстановлением радиуса орбиты"""
+        i = int(offset)
+        w = offset - i
+        a = grid[:, i].astype(np.float64)
+        b = grid[:, i + 1].astype(np.float64)
+        xyz = (1 - w) * a + w * b
+        radius = (1 - w) * np.linalg.norm(a, axis=1) + w * np.linalg.norm(b, axis=1)
+        return xyz * (radius / np.linalg.norm(xyz, axis=1))[:, None]
+
+    def _schedule_ephemeris(self, catalogue):
+        if self._ephemeris_task is None or self._ephemeris_task.done():
+            self._ephemeris_task = asyncio.ensure_future(self._update_ephemeris(catalogue))
+
+    async def _update_ephemeris(self, catalogue):
+        try:
+            self._ephemeris = await utils.run_sync(self._build_ephemeris, catalogue, self._get_timescale().now())
+        except Exception as e:
+            logger.warning(f"Не удалось построить сетку эфемерид Starlink: {e}")
+
+    def _utc_moment(self, timestamp):
+        """Время skyfield для unix-времени в секундах"""
+        return self._get_timescale().from_datetime(datetime.fromtimestamp(timestamp, timezone.utc))
+
+    def _build_ephemeris(self, catalogue, start):
+        """Сетка ITRF-положений всех спутников с шагом ephemeris_step на ephemeris_span вперёд (float32).
+
+        Начало сетки округляется вниз до минуты, чтобы в неё попадали запросы, округлённые до минуты."""
+        start = self._utc_moment(start.utc_datetime().timestamp() // 60 * 60)
+        step = self.config["ephemeris_step"]
+        steps = int(np.ceil(self.config["ephemeris_span"] / step)) + 1
+        xyz = np.empty((len(catalogue["names"]), steps, 3), dtype=np.float32)
+        # Блоками по 20 моментов: SGP4 держит GIL, короткие вызовы не замораживают цикл событий
+        for first in range(0, steps, 20):
+            offsets = np.arange(first, min(first + 20, steps)) * step / 86400.0
+            xyz[:, first:first + len(offsets)] = self._propagate_itrf(catalogue, self._get_timescale().tt_jd(start.tt + offsets))
+        return {
+            "key": self._get_propagator(catalogue)[0],
+            "start": start.tt,
+            "step": step,
+            "xyz": xyz,
+        }
+
+    def _observer(self, lat, lon):
+        """ITRF-координаты (км) точки на поверхности WGS84 и единичный вектор местной вертикали"""
+        lat, lon = np.radians(lat), np.radians(lon)
+        radius = _WGS84_A_KM / np.sqrt(1.0 - _WGS84_E2 * np.sin(lat) ** 2)
+        up = np.array([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+        return radius * np.array([up[0], up[1], (1.0 - _WGS84_E2) * up[2]]), up
+
+    def _sin_elevation(self, xyz, observer, up):
+        rho = xyz - observer
+        return (rho @ up) / np.linalg.norm(rho, axis=-1)
+
+    def _predict_passes(self, catalogue, lat, lon, hours, min_el, step=60, fine=5, chunk=20):
+        """Все пролёты выше min_el градусов над наблюдателем за hours часов.
+
+        Высота над горизонтом считается для всего каталога на грубой сетке step секунд блоками по chunk
+        моментов. Затем только интервалы, где спутник пересекает порог, уточняются по сетке fine секунд:
+        пересечения группируются по интервалу, поэтому каждое уточнение - один вызов SatrecArray.
+        Возвращает колонки, отсортированные по началу пролёта: sat, rise, peak, set (TT), max_elevation."""
+        observer, up = self._observer(lat, lon)
+        threshold = np.sin(np.radians(min_el))
+        start = self._get_timescale().now().tt
+        steps = int(hours * 3600 / step) + 1
+        sin_el = np.empty((len(catalogue["names"]), steps), dtype=np.float32)
+        for first in range(0, steps, chunk):
+            offsets = np.arange(first, min(first + chunk, steps)) * step / 86400.0
+            xyz = self._propagate_itrf(catalogue, self._get_timescale().tt_jd(start + offsets))
+            sin_el[:, first:first + len(offsets)] = self._sin_elevation(xyz, observer, up)
+
+        above = sin_el >= threshold
+        rises = np.argwhere(~above[:, :-1] & above[:, 1:])
+        sets = np.argwhere(above[:, :-1] & ~above[:, 1:])
+        rise_time = self._refine_crossings(catalogue, rises, start, step, fine, observer, up, threshold)
+        set_time = self._refine_crossings(catalogue, sets, start, step, fine, observer, up, threshold)
+
+        # Пролёты, начавшиеся до начала окна или не закончившиеся к его концу, обрезаются по окну
+        sats = np.concatenate([np.flatnonzero(above[:, 0]), rises[:, 0]])
+        begins = np.concatenate([np.full(above[:, 0].sum(), start), rise_time])
+        order = np.lexsort((begins, sats))
+        sats, begins = sats[order], begins[order]
+        end_sats = np.concatenate([sets[:, 0], np.flatnonzero(above[:, -1])])
+        ends = np.concatenate([set_time, np.full(above[:, -1].sum(), start + (steps - 1) * step / 86400.0)])
+        order = np.lexsort((ends, end_sats))
+        ends = ends[order]
+
+        first = np.clip(np.ceil((begins - start) * 86400.0 / step).astype(int), 0, steps - 1)
+        last = np.clip(np.floor((ends - start) * 86400.0 / step).astype(int), 0, steps - 1)
+        width = int((last - first).max()) + 1 if len(sats) else 1
+        window = first[:, None] + np.arange(width)
+        values = np.where(
+            window <= last[:, None], sin_el[sats[:, None], window.clip(max=steps - 1)], -np.inf
+        )
+        peak = (first + values.argmax(axis=1)).clip(1, steps - 2)
+        peak_time, top = self._refine_peaks(catalogue, sats, peak, start, step, fine, observer, up)
+        peak_time = np.clip(peak_time, begins, ends)
+
+        order = np.argsort(begins, kind="stable")
+        return {
+            "sat": sats[order],
+            "rise": begins[order],
+            "peak": peak_time[order],
+            "set": ends[order],
+            "max_elevation": np.degrees(np.arcsin(np.clip(top, -1, 1)))[order],
+        }
+
+    def _fine_sin_elevation(self, catalogue, sats, intervals, start, step, samples, observer, up):
+        """Синус высоты спутников sats на мелкой сетке samples (доли суток) от начала их грубых интервалов.
+
+        Спутники группируются по интервалу, поэтому каждая группа считается одним вызовом SatrecArray."""
+        values = np.empty((len(sats), len(samples)))
+        order = np.argsort(intervals, kind="stable")
+        unique, bounds = np.unique(intervals[order], return_index=True)
+        for interval, rows in zip(unique.tolist(), np.split(order, bounds[1:])):
+            xyz = self._sgp4_itrf(
+                _sgp4.SatrecArray([catalogue["satrec_list"][i] for i in sats[rows].tolist()]),
+                self._get_timescale().tt_jd(start + interval * step / 86400.0 + samples)
+            )
+            values[rows] = self._sin_elevation(xyz, observer, up)
+        return values
+
+    def _refine_peaks(self, catalogue, sats, peak, start, step, fine, observer, up):
+        """Момент (TT) и синус максимальной высоты по мелкой сетке на двух грубых интервалах вокруг вершины"""
+        self._get_propagator(catalogue)
+        samples = np.arange(0, 2 * step + fine, fine) / 86400.0
+        values = self._fine_sin_elevation(catalogue, sats, peak - 1, start, step, samples, observer, up)
+        best = values.argmax(axis=1) if len(sats) else np.empty(0, dtype=int)
+        return start + (peak - 1) * step / 86400.0 + samples[best], values[np.arange(len(sats)), best]
+
+    def _refine_crossings(self, catalogue, crossings, start, step, fine, observer, up, threshold):
+        """Момент пересечения порога (TT) для пар (спутник, грубый интервал) по мелкой сетке внутри интервала"""
+        self._get_propagator(catalogue)
+        samples = np.arange(0, step + fine, fine) / 86400.0
+        values = self._fine_sin_elevation(
+            catalogue, crossings[:, 0], crossings[:, 1], start, step, samples, observer, up
+        ) - threshold
+        rows = np.arange(len(crossings))
+        change = np.signbit(values[:, :-1]) != np.signbit(values[:, 1:])
+        j = np.where(change.any(axis=1), change.argmax(axis=1), len(samples) - 2) if len(rows) else rows
+        a, b = values[rows, j], values[rows, j + 1]
+        fraction = np.where(a != b, a / np.where(a != b, a - b, 1), 0.5).clip(0, 1)
+        return start + crossings[:, 1] * step / 86400.0 + samples[j] + fraction * fine / 86400.0
+
+    def _geodetic(self, x, y, z):
+        """Геодезические широта/долгота (градусы) и высота (км) над WGS84 из ITRF-координат в км"""
+        p = np.hypot(x, y)
+        lat = np.arctan2(z, p)
+        for _ in range(3):
+            sin_lat = np.sin(lat)
+            radius = _WGS84_A_KM / np.sqrt(1.0 - _WGS84_E2 * sin_lat * sin_lat)
+            hyp = z + radius * _WGS84_E2 * sin_lat
+            lat = np.arctan2(hyp, p)
+        alt = np.sqrt(hyp * hyp + p * p) - radius
+        return np.degrees(lat), np.degrees(np.arctan2(y, x)), alt
+
+    def _build_index(self, xyz, cell=500.0):
+        """Пространственный хеш ITRF-координат: номера ячеек кубической сетки, отсортированные для searchsorted.
+
+        Строится один раз на набор положений и обслуживает запросы по радиусу и k ближайших
+        с точным евклидовым расстоянием в км, без искажений у полюсов и антимеридиана."""
+        ids = np.flatnonzero(~np.isnan(xyz[:, 0]))
+        keys = self._cell_keys(np.floor(xyz[ids] / cell).astype(np.int64))
+        order = np.argsort(keys, kind="stable")
+        return {"xyz": xyz, "cell": cell, "ids": ids[order], "keys": keys[order]}
+
+    def _cell_keys(self, cells):
+        cells = cells + 1024
+        return (cells[..., 0] * 2048 + cells[..., 1]) * 2048 + cells[..., 2]
+
+    def _expand_ranges(self, lo, hi):
+        counts = hi - lo
+        return np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+    def _query_radius(self, index, point, radius):
+        """Спутники не дальше radius км от точки, отсортированные по расстоянию: (индексы, расстояния)"""
+        steps = int(np.ceil(radius / index["cell"]))
+        reach = np.arange(-steps, steps + 1)
+        offsets = np.stack(np.meshgrid(reach, reach, reach, indexing="ij"), axis=-1).reshape(-1, 3)
+        keys = self._cell_keys(np.floor(np.asarray(point) / index["cell"]).astype(np.int64) + offsets)
+        ids = index["ids"][self._expand_ranges(
+            np.searchsorted(index["keys"], keys, "left"),
+            np.searchsorted(index["keys"], keys, "right"),
+        )]
+        distances = np.linalg.norm(index["xyz"][ids] - point, axis=1)
+        keep = distances <= radius
+        order = np.argsort(distances[keep])
+        return ids[keep][order], distances[keep][order]
+
+    def _query_nearest(self, index, point, k):
+        """k ближайших к точке спутников: радиус поиска удваивается, пока не наберётся k"""
+        radius = index["cell"]
+        while True:
+            ids, distances = self._query_radius(index, point, radius)
+            if len(ids) >= min(k, len(index["ids"])):
+                return ids[:k], distances[:k]
+            radius *= 2
+
+    def _query_pairs(self, index, radius):
+        """Все пары (i, j), i < j, не дальше radius км друг от друга.
+
+        Размер ячейки индекса должен быть не меньше radius: тогда соседи точки лежат в её ячейке
+        и 26 соседних. Поиск идёт по занятым ячейкам, а не по точкам, и каждая пара ячеек просматривается
+        один раз: соседи с бо́льшим ключом - это следующая ячейка по z и четыре столбца из трёх ячеек по z,
+        то есть пять непрерывных диапазонов ключей. Пары точек из них перебираются одним массивом."""
+        keys, ids = index["keys"], index["ids"]
+        if not len(keys):
+            return ids[:0], ids[:0]
+        first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        cells, counts = keys[first], np.diff(np.r_[first, len(keys)])
+
+        columns = self._cell_keys(np.array([[0, 1, 0], [1, -1, 0], [1, 0, 0], [1, 1, 0]]))
+        columns -= self._cell_keys(np.zeros(3, dtype=np.int64))
+        lo = np.searchsorted(keys, cells[:, None] + np.r_[0, columns - 1], "left")
+        hi = np.searchsorted(keys, cells[:, None] + np.r_[1, columns + 1], "right")
+
+        width = (hi - lo).ravel()
+        sizes = counts.repeat(lo.shape[1]) * width
+        pair = np.repeat(np.arange(len(sizes)), sizes)
+        row, col = np.divmod(np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes), width[pair])
+        pa, pb = first[pair // lo.shape[1]] + row, lo.ravel()[pair] + col
+        # Позиции в отсортированном порядке: повтор пары или точка в паре с собой бывают только внутри ячейки
+        keep = pa < pb
+        pa, pb = pa[keep], pb[keep]
+        xyz = index["xyz"][ids]
+        delta = xyz[pa] - xyz[pb]
+        keep = np.einsum("ij,ij->i", delta, delta) <= radius * radius
+        a, b = ids[pa[keep]], ids[pb[keep]]
+        return np.minimum(a, b), np.maximum(a, b)
+
+    def _screen_conjunctions(self, catalogue, threshold, minutes, step=60, chunk=40):
+        """Сближения пар спутников ближе threshold км за minutes минут.
+
+        Положения и скорости считаются по SGP4 на сетке с шагом step секунд. В каждом узле пары-кандидаты
+        ищутся по ячейкам пространственного хеша с радиусом, который покрывает сближение в пределах полушага
+        в обе стороны: threshold плюс путь пары навстречу и отклонение орбит от прямой за полшага.
+        Момент наибольшего сближения кандидата уточняется на интервале до или после узла, в сторону
+        линейной оценки, по уже посчитанным положениям и скоростям, без дополнительных вызовов SGP4.
+        Возвращает колонки a, b, time (TT), distance (км), speed (км/с), отсортированные по расстоянию."""
+        _, _, satrecs = self._get_propagator(catalogue)
+        start = self._get_timescale().now().tt
+        steps = int(minutes * 60 / step) + 1
+        found = []
+        for first in range(0, steps, chunk):
+            # Узлы блока с запасом в один узел с каждой стороны: интервалы на границах блоков не теряются
+            nodes = np.arange(max(first - 1, 0), min(first + chunk + 1, steps))
+            r, v = self._sgp4_teme(satrecs, self._get_timescale().tt_jd(start + nodes * step / 86400.0))
+            # Узел за узлом: положения одного момента лежат в памяти подряд
+            r, v = np.ascontiguousarray(r.swapaxes(0, 1)), np.ascontiguousarray(v.swapaxes(0, 1))
+            fastest = np.nanmax(np.linalg.norm(v, axis=-1))
+            bend = _WGS72_MU / np.nanmin(np.linalg.norm(r, axis=-1)) ** 2 * step ** 2 / 4
+            radius = threshold + fastest * step + bend
+
+            a, b, left = [], [], []
+            for k in range(first - nodes[0], min(first + chunk, steps) - nodes[0]):
+                pair_a, pair_b = self._query_pairs(self._build_index(r[k], cell=radius), radius)
+                # Ближе всего при прямолинейном относительном движении в пределах полушага; от него
+                # настоящая траектория пары отходит не больше чем на bend
+                dr, dv = r[k, pair_b] - r[k, pair_a], v[k, pair_b] - v[k, pair_a]
+                tau = np.clip(-(dr * dv).sum(axis=1) / (dv * dv).sum(axis=1).clip(1e-12), -step / 2, step / 2)
+                keep = np.linalg.norm(dr + dv * tau[:, None], axis=1) - bend <= threshold
+                a.append(pair_a[keep])
+                b.append(pair_b[keep])
+                left.append((k - (tau[keep] < 0)).clip(0, len(nodes) - 2))
+
+            if a:
+                a, b, left = np.concatenate(a), np.concatenate(b), np.concatenate(left)
+                fraction, distance, speed = self._refine_conjunctions(r, v, a, b, left, step)
+                keep = distance <= threshold
+                tca = start + (nodes[left[keep]] + fraction[keep]) * step / 86400.0
+                found.append((a[keep], b[keep], tca, distance[keep], speed[keep]))
+
+        return self._merge_conjunctions(*(np.concatenate(column) for column in zip(*found)))
+
+    def _refine_conjunctions(self, r, v, a, b, left, step, iterations=4):
+        """Наименьшее расстояние пар (a, b) на интервале между узлами left и left + 1 сетки с шагом step секунд.
+
+        r и v - положения и скорости в TEME формы (узлы, спутники, 3).
+        Относительное движение пары на интервале - кубический многочлен Эрмита по положениям и скоростям
+        в двух узлах (ошибка - метры при шаге в десятки секунд). Минимум квадрата расстояния ищется
+        итерациями Ньютона от оценки по хорде и сравнивается с концами интервала.
+        Возвращает долю шага до момента сближения, расстояние (км) и относительную скорость (км/с)."""
+        p0 = r[left, b] - r[left, a]
+        p1 = r[left + 1, b] - r[left + 1, a]
+        m0 = (v[left, b] - v[left, a]) * step
+        m1 = (v[left + 1, b] - v[left + 1, a]) * step
+        c2 = 3 * (p1 - p0) - 2 * m0 - m1
+        c3 = 2 * (p0 - p1) + m0 + m1
+
+        def at(s):
+            s = s[:, None]
+            return p0 + s * (m0 + s * (c2 + s * c3)), m0 + s * (2 * c2 + 3 * s * c3)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            chord = p1 - p0
+            s = np.clip(-(p0 * chord).sum(axis=1) / (chord * chord).sum(axis=1).clip(1e-12), 0, 1)
+            for _ in range(iterations):
+                h, dh = at(s)
+                curve = (dh * dh + h * (2 * c2 + 6 * s[:, None] * c3)).sum(axis=1)
+                s = np.clip(s - (h * dh).sum(axis=1) / np.where(curve > 0, curve, np.inf), 0, 1)
+
+            # Минимум может оказаться на конце интервала, если сближение продолжается за его пределами
+            candidates = np.stack((s, np.zeros_like(s), np.ones_like(s)))
+            distance = np.stack([np.linalg.norm(at(c)[0], axis=1) for c in candidates])
+            best = np.argmin(np.where(np.isnan(distance), np.inf, distance), axis=0)
+        columns = np.arange(len(s))
+        fraction = candidates[best, columns]
+        return fraction, distance[best, columns], np.linalg.norm(at(fraction)[1], axis=1) / step
+
+    def _merge_conjunctions(self, a, b, tca, distance, speed, gap=5):
+        """Сводит повторные обнаружения одной встречи в одно событие, колонки сортируются по расстоянию.
+
+        Одна встреча находится в нескольких соседних узлах сетки: обнаружения одной пары,
+        разделённые меньше чем gap минут, считаются одним событием с наименьшим расстоянием."""
+        order = np.lexsort((tca, b, a))
+        a, b, tca, distance, speed = a[order], b[order], tca[order], distance[order], speed[order]
+        new = np.ones(len(a), dtype=bool)
+        new[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1]) | (np.diff(tca) > gap / 1440.0)
+        event = np.cumsum(new) - 1
+        order = np.lexsort((distance, event))
+        best = order[np.r_[True, event[order][1:] != event[order][:-1]]] if len(order) else order
+        best = best[np.argsort(distance[best], kind="stable")]
+        return {"a": a[best], "b": b[best], "time": tca[best], "distance": distance[best], "speed": speed[best]}
+
+    def _select(self, positions, index):
+        return {key: column[index] for key, column in positions.items()}
+
+    def _get_base_map(self):
+        """Статичная часть карты (подложка и подписи стран одним слоем), собирается один раз"""
+        if self._base_map is None:
+            fig = go.Figure(
+                go.Scattergeo(
+                    lon=[lon for _, lon, _ in _COUNTRIES],
+                    lat=[lat for _, _, lat in _COUNTRIES],
+                    text=[name for name, _, _ in _COUNTRIES],
+                    mode="text",
+                    textfont=dict(size=6, color="black"),
+                    hoverinfo="skip",
+                    showlegend=False
+                )
+            )
+            fig.update_layout(
+                showlegend=True,
+                geo=dict(
+                    scope="world",
+                    projection_type="natural earth",
+                    showland=True,
+                    landcolor="lightgreen",
+                    showcountries=True,
+                    countrycolor="black",
+                    showocean=True,
+                    oceancolor="lightblue"
+                ),
+                margin=dict(l=10, r=10, t=40, b=10),
+                width=1200,
+                height=600
+            )
+            self._base_map = fig.to_dict()
+        return self._base_map
+
+    async def _generate_map(self, positions, tracks=None):
+        count = len(positions["name"])
+        base = self._get_base_map()
+        if count > self.config["density_threshold"]:
+            data = self._density_layer(positions)
+        else:
+            data = [
+                go.Scattergeo(
+                    lon=positions["longitude"],
+                    lat=positions["latitude"],
+                    text=positions["name"],
+                    mode="markers+text",
+                    marker=dict(size=8, color="red", symbol="circle"),
+                    textfont=dict(size=8, color="black"),
+                    textposition="top center",
+                    name="Satellites"
+                ).to_plotly_json()
+            ]
+        if tracks is not None:
+            data = self._track_layer(tracks) + data
+        if count <= 50:
+            data = base["data"] + data
+
+        figure = {
+            "data": data,
+            "layout": dict(base["layout"], title={"text": f"Положение спутников Starlink ({count})"})
+        }
+        return io.BytesIO(await self._render(figure, 1200, 600))
+
+    def _track_layer(self, tracks):
+        """Линии трасс, по одной на спутник; на переходе через антимеридиан линия разрывается"""
+        lon = tracks["longitude"]
+        lat = tracks["latitude"]
+        jump = np.abs(np.diff(lon, axis=1)) > 180
+        layers = []
+        for name, sat_lon, sat_lat, sat_jump in zip(tracks["name"], lon, lat, jump):
+            breaks = np.flatnonzero(sat_jump) + 1
+            layers.append(go.Scattergeo(
+                lon=np.insert(sat_lon, breaks, np.nan),
+                lat=np.insert(sat_lat, breaks, np.nan),
+                mode="lines",
+                line=dict(width=2),
+                hoverinfo="skip",
+                name=str(name)
+            ).to_plotly_json())
+        return layers
+
+    def _density_layer(self, positions, step=3, labeled=5):
+        """Слой плотности для больших выборок: число спутников в ячейках step x step градусов.
+
+        Подписываются только первые labeled спутников, остальные видны только через плотность,
+        поэтому время отрисовки не зависит от размера выборки."""
+        counts, lon_edges, lat_edges = np.histogram2d(
+            positions["longitude"],
+            positions["latitude"],
+            bins=(360 // step, 180 // step),
+            range=((-180, 180), (-90, 90))
+        )
+        lon_idx, lat_idx = np.nonzero(counts)
+        return [
+            go.Scattergeo(
+                lon=lon_edges[lon_idx] + step / 2,
+                lat=lat_edges[lat_idx] + step / 2,
+                text=[f"{int(value)}" for value in counts[lon_idx, lat_idx]],
+                mode="markers",
+                marker=dict(
+                    size=10,
+                    symbol="square",
+                    opacity=0.8,
+                    color=counts[lon_idx, lat_idx],
+                    colorscale="YlOrRd",
+                    colorbar=dict(title="Спутников", thickness=12)
+                ),
+                hoverinfo="text",
+                name="Плотность"
+            ).to_plotly_json(),
             go.Scattergeo(
-                lon=[pos["longitude"] for pos in positions],
-                lat=[pos["latitude"] for pos in positions],
-                text=[pos["name"] for pos in positions],
+                lon=positions["longitude"][:labeled],
+                lat=positions["latitude"][:labeled],
+                text=positions["name"][:labeled],
                 mode="markers+text",
-                marker=dict(size=8, color="red", symbol="circle"),
+                marker=dict(size=8, color="blue", symbol="circle"),
                 textfont=dict(size=8, color="black"),
                 textposition="top center",
                 name="Satellites"
+            ).to_plotly_json(),
+        ]
+
+    def _get_render_pool(self):
+        if self._render_pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            self._render_pool = ProcessPoolExecutor(
+                max_workers=self.config["render_workers"],
+                mp_context=multiprocessing.get_context("fork" if "fork" in methods else None)
             )
-        )
+        return self._render_pool
 
-        countries = [
-            ("Афганистан", 65, 33),
-            ("Албания", 20, 41),
-            ("Алжир", 3, 28),
-            ("Андорра", 1.5, 42.5),
-            ("Ангола", 17, -12),
-            ("Антигуа и Барбуда", -61.8, 17),
-            ("Аргентина", -65, -35),
-            ("Армения", 45, 40),
-            ("Австралия", 135, -25),
-            ("Австрия", 13, 47),
-            ("Азербайджан", 47, 40),
-            ("Багамы", -77, 24),
-            ("Бахрейн", 50.5, 26),
-            ("Бангладеш", 90, 24),
-            ("Барбадос", -59.5, 13),
-            ("Беларусь", 28, 53),
-            ("Бельгия", 4, 50.5),
-            ("Белиз", -88.5, 17.5),
-            ("Бенин", 2.5, 9.5),
-            ("Бутан", 90.5, 27.5),
-            ("Боливия", -65, -17),
-            ("Босния и Герцеговина", 18, 44),
-            ("Ботсвана", 24, -22),
-            ("Бразилия", -50, -10),
-            ("Бруней", 114.5, 4.5),
-            ("Болгария", 25, 43),
-            ("Буркина-Фасо", -2, 12),
-            ("Бурунди", 30, -3.5),
-            ("Кабо-Верде", -24, 16),
-            ("Камбоджа", 105, 13),
-            ("Камерун", 12, 6),
-            ("Канада", -100, 60),
-            ("ЦАР", 21, 7),
-            ("Чад", 19, 15),
-            ("Чили", -70, -30),
-            ("Китай", 100, 35),
-            ("Колумбия", -74, 4),
-            ("Коморы", 44, -12),
-            ("Конго (ДРК)", 25, 0),
-            ("Конго (Республика)", 15, -1),
-            ("Коста-Рика", -84, 10),
-            ("Хорватия", 16, 45),
-            ("Куба", -80, 22),
-            ("Кипр", 33, 35),
-            ("Чехия", 15, 50),
-            ("Дания", 10, 56),
-            ("Джибути", 43, 11),
-            ("Доминика", -61.3, 15.5),
-            ("Доминиканская Республика", -70, 19),
-            ("Эквадор", -78, -2),
-            ("Египет", 30, 26),
-            ("Сальвадор", -89, 13.5),
-            ("Экваториальная Гвинея", 10, 1),
-            ("Эритрея", 39, 15),
-            ("Эстония", 26, 58),
-            ("Эсватини", 31.5, -26.5),
-            ("Эфиопия", 40, 9),
-            ("Фиджи", 178, -18),
-            ("Финляндия", 25, 64),
-            ("Франция", 0, 46),
-            ("Габон", 11.5, -1),
-            ("Гамбия", -16.5, 13.5),
-            ("Грузия", 43.5, 42),
-            ("Германия", 10, 50),
-            ("Гана", -1, 8),
-            ("Греция", 22, 39),
-            ("Гренада", -61.7, 12),
-            ("Гватемала", -90.5, 15.5),
-            ("Гвинея", -11, 10),
-            ("Гвинея-Бисау", -15, 12),
-            ("Гайана", -59, 5),
-            ("Гаити", -72.5, 19),
-            ("Гондурас", -87.5, 15),
-            ("Венгрия", 19, 47),
-            ("Исландия", -18, 64),
-            ("Индия", 80, 20),
-            ("Индонезия", 120, -5),
-            ("Иран", 53, 32),
-            ("Ирак", 44, 33),
-            ("Ирландия", -8, 53),
-            ("Израиль", 34.5, 31.5),
-            ("Италия", 12, 42),
-            ("Ямайка", -77.5, 18),
-            ("Япония", 140, 35),
-            ("Иордания", 36, 31),
-            ("Казахстан", 68, 48),
-            ("Кения", 37, -1),
-            ("Кирибати", 172.5, 1.5),
-            ("Кувейт", 47.5, 29.5),
-            ("Киргизия", 75, 41),
-            ("Лаос", 103, 18),
-            ("Латвия", 24, 57),
-            ("Ливан", 35.5, 33.5),
-            ("Лесото", 28, -29.5),
-            ("Либерия", -9.5, 6.5),
-            ("Ливия", 17, 27),
-            ("Лихтенштейн", 9.5, 47),
-            ("Литва", 24, 55),
-            ("Люксембург", 6, 49.5),
-            ("Мадагаскар", 47, -20),
-            ("Малави", 34, -13.5),
-            ("Малайзия", 112, 3),
-            ("Мальдивы", 73, 3.5),
-            ("Мали", -4, 17),
-            ("Мальта", 14.5, 35.9),
-            ("Маршалловы Острова", 171, 7),
-            ("Мавритания", -12, 20),
-            ("Маврикий", 57.5, -20),
-            ("Мексика", -100, 25),
-            ("Микронезия", 158, 6.5),
-            ("Молдова", 29, 47),
-            ("Монако", 7.4, 43.7),
-            ("Монголия", 105, 46),
-            ("Черногория", 19, 42),
-            ("Марокко", -6, 32),
-            ("Мозамбик", 35, -18.5),
-            ("Мьянма", 96, 21),
-            ("Намибия", 17, -22),
-            ("Науру", 166.9, -0.5),
-            ("Непал", 84, 28),
-            ("Нидерланды", 5.5, 52),
-            ("Новая Зеландия", 175, -40),
-            ("Никарагуа", -85.5, 13),
-            ("Нигер", 8, 16),
-            ("Нигерия", 8, 10),
-            ("Северная Корея", 126, 40),
-            ("Северная Македония", 21.5, 41.5),
-            ("Норвегия", 10, 60),
-            ("Оман", 56, 21),
-            ("Пакистан", 70, 30),
-            ("Палау", 134.5, 7.5),
-            ("Панама", -80, 9),
-            ("Папуа — Новая Гвинея", 147, -6),
-            ("Парагвай", -58, -23),
-            ("Перу", -75, -10),
-            ("Филиппины", 122, 14),
-            ("Польша", 20, 52),
-            ("Португалия", -8, 39.5),
-            ("Катар", 51.5, 25.5),
-            ("Румыния", 25, 46),
-            ("Россия", 100, 60),
-            ("Руанда", 30, -2),
-            ("Сент-Китс и Невис", -62.7, 17.3),
-            ("Сент-Люсия", -61, 13.8),
-            ("Сент-Винсент и Гренадины", -61.2, 13.2),
-            ("Самоа", -172, -13.5),
-            ("Сан-Марино", 12.4, 43.9),
-            ("Сан-Томе и Принсипи", 7, 1),
-            ("Саудовская Аравия", 45, 24),
-            ("Сенегал", -14.5, 14.5),
-            ("Сербия", 20.5, 44),
-            ("Сейшелы", 55.5, -4.5),
-            ("Сьерра-Леоне", -11.5, 8.5),
-            ("Сингапур", 103.8, 1.3),
-            ("Словакия", 19.5, 48.5),
-            ("Словения", 15, 46),
-            ("Соломоновы Острова", 160, -9),
-            ("Сомали", 49, 5),
-            ("Южная Африка", 25, -30),
-            ("Южная Корея", 127, 36),
-            ("Южный Судан", 31, 7),
-            ("Испания", -4, 40),
-            ("Шри-Ланка", 81, 7),
-            ("Судан", 30, 15),
-            ("Суринам", -56, 4),
-            ("Швеция", 15, 64),
-            ("Швейцария", 8, 47),
-            ("Сирия", 38, 35),
-            ("Тайвань", 121, 23.5),
-            ("Таджикистан", 71, 39),
-            ("Танзания", 35, -6),
-            ("Таиланд", 100, 15),
-            ("Восточный Тимор", 125.5, -8.5),
-            ("Того", 1.2, 8),
-            ("Тонга", -175, -20),
-            ("Тринидад и Тобаго", -61.5, 10.5),
-            ("Тунис", 9, 34),
-            ("Турция", 35, 39),
-            ("Туркменистан", 60, 38),
-            ("Тувалу", 179, -8),
-            ("Уганда", 32, 1),
-            ("Украина", 30, 50),
-            ("ОАЭ", 54, 24),
-            ("Великобритания", -2, 54),
-            ("США", -100, 40),
-            ("Уругвай", -56, -33),
-            ("Узбекистан", 64, 41),
-            ("Вануату", 167, -15),
-            ("Ватикан", 12.45, 41.9),
-            ("Венесуэла", -66, 8),
-            ("Вьетнам", 108, 16),
-            ("Йемен", 48, 15),
-            ("Замбия", 28, -15),
-            ("Зимбабве", 30, -20)
-        ]
+    def _reset_render_pool(self):
+        """Останавливает пул отрисовки вместе с зависшими процессами kaleido"""
+        if self._render_pool is None:
+            return
+        for process in list((self._render_pool._processes or {}).values()):
+            process.terminate()
+        self._render_pool.shutdown(wait=False, cancel_futures=True)
+        self._render_pool = None
 
-        if len(positions) <= 50:
-            for name, lon, lat in countries:
-                fig.add_trace(
-                    go.Scattergeo(
-                        lon=[lon],
-                        lat=[lat],
-                        text=[name],
-                        mode="text",
-                        textfont=dict(size=6, color="black"),
-                        showlegend=False
-                    )
-                )
+    def _prepare_renderer(self):
+        """Запускает подготовку отрисовки при первой команде с картой, параллельно с загрузкой данных"""
+        if self._warmup is None:
+            self._warmup = asyncio.ensure_future(self._warm_renderer())
 
-        fig.update_layout(
-            title_text=f"Положение спутников Starlink ({len(positions)})",
-            showlegend=True,
-            geo=dict(
-                scope="world",
-                projection_type="natural earth",
-                showland=True,
-                landcolor="lightgreen",
-                showcountries=True,
-                countrycolor="black",
-                showocean=True,
-                oceancolor="lightblue"
-            ),
-            margin=dict(l=10, r=10, t=40, b=10),
-            width=1200,
-            height=600
-        )
+    async def _warm_renderer(self):
+        """Запускает процесс отрисовки и kaleido заранее, чтобы первая карта не ждала их старта"""
+        try:
+            await self._render({"data": [], "layout": {}}, 10, 10)
+        except Exception as e:
+            logger.warning(f"Не удалось подготовить отрисовку карт: {e}")
+
+    async def _render(self, figure, width, height):
+        """PNG фигуры plotly, отрисованный в отдельном процессе с ограничением очереди и времени"""
+        if self._render_jobs >= self.config["render_queue"]:
+            raise RuntimeError("Слишком много карт в очереди на отрисовку, попробуйте позже")
 
-        buf = io.BytesIO()
-        fig.write_image(buf, format="png", engine="kaleido")
-        buf.seek(0)
-        return buf
+        self._render_jobs += 1
+        try:
+            if self._render_slots is None:
+                self._render_slots = asyncio.Semaphore(self.config["render_workers"])
+            async with self._render_slots:
+                # Пул берётся только после получения слота: зависшая отрисовка перед этим
+                # могла остановить прежний пул, и задание уйдёт уже в новый
+                job = asyncio.get_event_loop().run_in_executor(
+                    self._get_render_pool(),
+                    functools.partial(pio.to_image, format="png", width=width, height=height),
+                    figure
+                )
+                try:
+                    return await asyncio.wait_for(job, self.config["render_timeout"])
+                except asyncio.TimeoutError:
+                    self._reset_render_pool()
+                    raise RuntimeError("Отрисовка карты заняла слишком много времени")
+        finally:
+            self._render_jobs -= 1
 
-    async def unload(self):
+    async def on_unload(self):
+        for task in (self._tle_refresh, self._ephemeris_task, self._speed_task):
+            if task and not task.done():
+                task.cancel()
+        self._reset_render_pool()
         if self.session:
             await self.session.close()
\ No newline at end of file
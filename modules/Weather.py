@@ -8,9 +8,27 @@
 
 from .. import loader, utils
 import aiohttp
+import asyncio
 import datetime
+import difflib
+import io
+import logging
+import math
+import os
+import time
+from PIL import Image, ImageDraw
 from telethon.tl.types import Message
 
+logger = logging.getLogger(__name__)
+
+_TILE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "Weather", "tiles")
+_TILE_LAYERS = {
+    # слой: (адрес, сколько секунд тайл считается свежим)
+    "osm": ("https://tile.openstreetmap.org/{z}/{x}/{y}.png", 7 * 86400),
+    # радар OWM обновляется раз в 10 минут
+    "precipitation": ("https://tile.openweathermap.org/map/precipitation_new/{z}/{x}/{y}.png?appid={token}", 600),
+}
+
 @loader.tds
 class WeatherMod(loader.Module):
     """Модуль для получения погоды в любом городе мира"""
@@ -28,11 +46,44 @@ class WeatherMod(loader.Module):
         "current": "📍 Текущая погода в",
         "forecast": "📅 Прогноз на",
         "no_city": "🌍 Укажите город",
-        "map_error": "❌ Не удалось загрузить карту"
+        "map_error": "❌ Не удалось загрузить карту",
+        "batch": "🌍 Погода в городах ({count}):\n\n<pre>{table}</pre>",
+        "batch_limit": "🌍 Можно указать не больше {limit} городов"
     }
 
     def __init__(self):
-        self.config = loader.ModuleConfig("token", "27f55366fdc2d2df4bdcdb6a2295251c", "API токен от OpenWeatherMap")
+        self.config = loader.ModuleConfig(
+            loader.ConfigValue("token", "27f55366fdc2d2df4bdcdb6a2295251c", "API токен от OpenWeatherMap"),
+            loader.ConfigValue(
+                "cache_ttl",
+                300,
+                "Сколько секунд ответы OpenWeatherMap берутся из кеша (кнопки, подробности, карта)",
+                validator=loader.validators.Integer(minimum=0)
+            ),
+            loader.ConfigValue(
+                "map_zoom",
+                7,
+                "Масштаб карты осадков (3 - страна, 10 - город)",
+                validator=loader.validators.Integer(minimum=3, maximum=10)
+            ),
+            loader.ConfigValue(
+                "tile_cache_mb",
+                50,
+                "Размер кеша тайлов карты на диске (МБ)",
+                validator=loader.validators.Integer(minimum=1)
+            ),
+            loader.ConfigValue(
+                "batch_concurrency",
+                8,
+                "Сколько городов из списка запрашивается одновременно (не больше 10 соединений сессии)",
+                validator=loader.validators.Integer(minimum=1, maximum=10)
+            ),
+        )
+        self._cache = {}
+        self._session = None
+        self._geocoding = {}
+        self._guesses = {}
+        self._requests = {}
 
     async def client_ready(self, client, db):
         self._db = db
@@ -40,21 +91,26 @@ class WeatherMod(loader.Module):
 
     @loader.command()
     async def weathercmd(self, message):
-        """<город> - Получить текущую погоду и прогноз на 5 дней
+        """<город>[; <город>...] - Получить текущую погоду и прогноз на 5 дней, для списка городов через ; или с новой строки - сводную таблицу
         Примеры:
         .weather Москва
         .weather Moscow 
-        .weather New York"""
+        .weather New York
+        .weather London, GB
+        .weather Москва; Париж; Токио"""
         if args := utils.get_args_raw(message):
             city = args
         else:
             return await utils.answer(message, self.strings["no_city"])
 
-        weather = await self._get_weather(city)
+        # Запятая остаётся частью названия ("London, GB"), города списка разделяются ; или переводом строки
+        if ";" in city or "\n" in city:
+            return await self._batch_weather(message, city.replace("\n", ";").split(";"))
+
+        weather, forecast = await self._get_weather_and_forecast(city)
         if not weather or weather.get("cod") != 200:
             return await utils.answer(message, self.strings["city_not_found"])
 
-        forecast = await self._get_forecast(city)
         if not forecast:
             return await utils.answer(message, self.strings["city_not_found"])
         
@@ -73,35 +129,183 @@ class WeatherMod(loader.Module):
             ]
         )
 
-    async def _get_weather(self, city):
-        url = "http://api.openweathermap.org/data/2.5/weather"
-        params = {
-            "q": city,
-            "appid": self.config["token"],
-            "units": "metric",
-            "lang": "ru"
-        }
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as response:
+    async def _batch_weather(self, message, cities, limit=50):
+        """Текущая погода для списка городов одной таблицей.
+
+        Повторы убираются до запросов, а разные названия одного места - по координатам геокодера.
+        Одновременно выполняется не больше batch_concurrency запросов, поэтому весь список занимает
+        время нескольких запросов, а не их сумму."""
+        unique = {}
+        for city in cities:
+            if city.strip():
+                unique.setdefault(self._normalize(city), city.strip())
+        cities = list(unique.values())
+        if not cities:
+            return await utils.answer(message, self.strings["no_city"])
+        if len(cities) > limit:
+            return await utils.answer(message, self.strings["batch_limit"].format(limit=limit))
+
+        semaphore = asyncio.Semaphore(self.config["batch_concurrency"])
+
+        async def fetch(city):
+            async with semaphore:
                 try:
-                    return await response.json()
-                except:
-                    return None
+                    weather = await self._get_weather(city)
+                    # Город уже в индексе геокодирования, координаты берутся без запроса
+                    return (await self._geocode(city) if weather else None), weather
+                except Exception:
+                    return None, None
+
+        results = await asyncio.gather(*(fetch(city) for city in cities))
+
+        width = min(max(len(city) for city in cities), 20)
+        rows, seen = [], set()
+        for city, (coordinates, weather) in zip(cities, results):
+            if coordinates:
+                if tuple(coordinates) in seen:
+                    continue
+                seen.add(tuple(coordinates))
+            name = city[:width].ljust(width)
+            if not weather or weather.get("cod") != 200:
+                rows.append(f"{name}  {self.strings['city_not_found']}")
+                continue
+            rows.append(
+                f"{name} {round(weather['main']['temp']):>4}°C {weather['wind']['speed']:>5} м/с "
+                f"{weather['main']['humidity']:>3}%  {weather['weather'][0]['description']}"
+            )
+
+        await utils.answer(
+            message,
+            self.strings["batch"].format(count=len(rows), table=utils.escape_html("\n".join(rows)))
+        )
+
+    async def _get_weather(self, city):
+        return await self._request("weather", city)
 
     async def _get_forecast(self, city):
-        url = "http://api.openweathermap.org/data/2.5/forecast"
+        return await self._request("forecast", city)
+
+    async def _get_weather_and_forecast(self, city):
+        """Текущая погода и прогноз параллельно: время ответа - один запрос, а не два подряд"""
+        return await asyncio.gather(self._get_weather(city), self._get_forecast(city))
+
+    def _get_session(self):
+        """Общая сессия с пулом соединений: keep-alive и кеш DNS переживают отдельные запросы"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=10, ttl_dns_cache=600, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=20)
+            )
+        return self._session
+
+    def _normalize(self, city):
+        return " ".join(city.lower().replace("ё", "е").split())
+
+    async def _geocode(self, city):
+        """Координаты города [lat, lon] из локального индекса в базе модуля, при промахе - через геокодер OWM.
+
+        Одновременные запросы одного города ждут один вызов геокодера."""
+        key = self._normalize(city)
+        index = self._db.get(__name__, "geocode", {})
+        if key in index:
+            return index[key]
+        if key in self._guesses:
+            return self._guesses[key]
+
+        if key not in self._geocoding:
+            self._geocoding[key] = asyncio.ensure_future(self._lookup_city(city, key))
+        try:
+            return await asyncio.shield(self._geocoding[key])
+        finally:
+            self._geocoding.pop(key, None)
+
+    async def _lookup_city(self, city, key):
+        """Запрашивает геокодер OWM и сохраняет в индекс город под всеми его названиями (local_names).
+
+        Если геокодер город не знает (пустой ответ, например из-за опечатки), берётся самое похожее
+        из уже известных названий. Такая догадка запоминается только до перезагрузки и в индекс не пишется.
+        Ответ с ошибкой (токен, лимит запросов, сбой сервера) ничего не сохраняет."""
+        url = "http://api.openweathermap.org/geo/1.0/direct"
+        params = {"q": city, "limit": 1, "appid": self.config["token"]}
+        async with self._get_session().get(url, params=params) as response:
+            try:
+                places = await response.json()
+            except:
+                return None
+
+        if not isinstance(places, list):
+            return None
+
+        index = self._db.get(__name__, "geocode", {})
+        if not places:
+            match = difflib.get_close_matches(key, list(index), n=1, cutoff=0.8)
+            if not match:
+                return None
+            self._guesses[key] = index[match[0]]
+            return self._guesses[key]
+
+        place = places[0]
+        coordinates = [round(place["lat"], 4), round(place["lon"], 4)]
+        for name in [place.get("name", "")] + list((place.get("local_names") or {}).values()):
+            if name:
+                index[self._normalize(name)] = coordinates
+
+        index[key] = coordinates
+        self._db.set(__name__, "geocode", index)
+        return coordinates
+
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry and time.time() - entry[0] < self.config["cache_ttl"]:
+            return entry[1]
+
+    def _store(self, key, data):
+        now = time.time()
+        self._cache = {
+            cached: entry for cached, entry in self._cache.items()
+            if now - entry[0] < self.config["cache_ttl"]
+        }
+        self._cache[key] = (now, data)
+
+    async def _request(self, endpoint, city):
+        """Ответ /weather или /forecast для города по его координатам из индекса геокодирования.
+
+        Успешные ответы кешируются на cache_ttl секунд по координатам, поэтому разные написания
+        одного города ("Москва", "moscow") используют одну запись."""
+        coordinates = await self._geocode(city)
+        if not coordinates:
+            return None
+        lat, lon = coordinates
+        key = (endpoint, round(lat, 2), round(lon, 2))
+        if (data := self._cached(key)) is not None:
+            return data
+
+        # Одинаковые запросы, пришедшие одновременно (разные написания одного города), ждут один ответ
+        if key not in self._requests:
+            self._requests[key] = asyncio.ensure_future(self._fetch(endpoint, lat, lon, key))
+        try:
+            return await asyncio.shield(self._requests[key])
+        finally:
+            self._requests.pop(key, None)
+
+    async def _fetch(self, endpoint, lat, lon, key):
+        url = f"http://api.openweathermap.org/data/2.5/{endpoint}"
         params = {
-            "q": city,
+            "lat": lat,
+            "lon": lon,
             "appid": self.config["token"],
             "units": "metric",
             "lang": "ru"
         }
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as response:
-                try:
-                    return await response.json()
-                except:
-                    return None
+        async with self._get_session().get(url, params=params) as response:
+            try:
+                data = await response.json()
+            except:
+                return None
+
+        if str(data.get("cod")) == "200":
+            self._store(key, data)
+        return data
 
     def _format_current(self, data, city):
         return (
@@ -136,11 +340,10 @@ class WeatherMod(loader.Module):
 
     async def _update_weather(self, call, city):
         """Обработчик кнопки обновления"""
-        weather = await self._get_weather(city)
+        weather, forecast = await self._get_weather_and_forecast(city)
         if not weather or weather.get("cod") != 200:
             return await call.answer(self.strings["city_not_found"], show_alert=True)
             
-        forecast = await self._get_forecast(city)
         if not forecast:
             return await call.answer(self.strings["city_not_found"], show_alert=True)
         
@@ -198,19 +401,133 @@ class WeatherMod(loader.Module):
             lat = weather['coord']['lat']
             lon = weather['coord']['lon']
             
-            map_url = f"https://tile.openweathermap.org/map/precipitation_new/10/{lat}/{lon}.png?appid={self.config['token']}"
-            
             try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(map_url) as response:
-                        if response.status == 200:
-                            map_data = await response.read()
-                            await self._client.send_file(
-                                call.message.chat.id,
-                                map_data,
-                                caption=f"🗺 Карта осадков для {city}"
-                            )
-                        else:
-                            await call.answer(self.strings["map_error"], show_alert=True)
+                map_data = await self._precipitation_map(lat, lon)
+                if map_data is None:
+                    return await call.answer(self.strings["map_error"], show_alert=True)
+                await self._client.send_file(
+                    call.message.chat.id,
+                    map_data,
+                    caption=f"🗺 Карта осадков для {city}\n© OpenStreetMap, OpenWeatherMap"
+                )
             except:
-                await call.answer(self.strings["map_error"], show_alert=True)
\ No newline at end of file
+                await call.answer(self.strings["map_error"], show_alert=True)
+
+    def _tile_position(self, lat, lon, zoom):
+        """Дробные координаты тайла (x, y) точки в проекции Web Mercator"""
+        lat = max(min(lat, 85.0511), -85.0511)
+        scale = 2 ** zoom
+        x = (lon + 180.0) / 360.0 * scale
+        y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * scale
+        return x, y
+
+    async def _precipitation_map(self, lat, lon, size=512):
+        """PNG size x size: мозаика 3x3 тайлов OSM с наложенным радаром осадков, город в центре"""
+        zoom = self.config["map_zoom"]
+        x, y = self._tile_position(lat, lon, zoom)
+        tiles = [(int(x) + dx, int(y) + dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1)]
+        base, radar = await asyncio.gather(
+            asyncio.gather(*(self._get_tile("osm", zoom, tx, ty) for tx, ty in tiles)),
+            asyncio.gather(*(self._get_tile("precipitation", zoom, tx, ty) for tx, ty in tiles)),
+        )
+        if not any(radar):
+            return None
+        await utils.run_sync(self._trim_tile_cache)
+        return await utils.run_sync(self._compose_map, tiles, base, radar, x, y, size)
+
+    def _compose_map(self, tiles, base, radar, x, y, size):
+        left, top = tiles[0]
+        mosaic = Image.new("RGBA", (768, 768), (220, 220, 220, 255))
+        for (tx, ty), base_tile, radar_tile in zip(tiles, base, radar):
+            offset = ((tx - left) * 256, (ty - top) * 256)
+            for data in (base_tile, radar_tile):
+                if data:
+                    tile = Image.open(io.BytesIO(data)).convert("RGBA")
+                    mosaic.alpha_composite(tile, offset)
+
+        center_x, center_y = round((x - left) * 256), round((y - top) * 256)
+        draw = ImageDraw.Draw(mosaic)
+        draw.ellipse((center_x - 6, center_y - 6, center_x + 6, center_y + 6), fill="red", outline="white", width=2)
+        crop = mosaic.crop((center_x - size // 2, center_y - size // 2, center_x + size // 2, center_y + size // 2))
+
+        result = io.BytesIO()
+        crop.convert("RGB").save(result, format="PNG")
+        result.name = "precipitation.png"
+        result.seek(0)
+        return result
+
+    async def _get_tile(self, layer, zoom, x, y):
+        """Тайл из кеша на диске, если он свежее срока слоя, иначе с сервера; None при ошибке"""
+        url, ttl = _TILE_LAYERS[layer]
+        x %= 2 ** zoom
+        if not 0 <= y < 2 ** zoom:
+            return None
+        path = os.path.join(_TILE_DIR, layer, str(zoom), str(x), f"{y}.png")
+        data = await utils.run_sync(self._read_tile, path, ttl)
+        if data is not None:
+            return data
+
+        try:
+            async with self._get_session().get(
+                url.format(z=zoom, x=x, y=y, token=self.config["token"]),
+                headers={"User-Agent": "Hikka Weather module"}
+            ) as response:
+                if response.status != 200:
+                    return None
+                data = await response.read()
+        except Exception:
+            return None
+
+        await utils.run_sync(self._save_tile, path, data)
+        return data
+
+    def _read_tile(self, path, ttl):
+        """Тайл из кеша на диске, если он свежее ttl секунд, иначе None"""
+        try:
+            stat = os.stat(path)
+            if time.time() - stat.st_mtime >= ttl:
+                return None
+            with open(path, "rb") as file:
+                data = file.read()
+            # Время доступа - для вытеснения давно не использованных, время изменения - для срока
+            os.utime(path, (time.time(), stat.st_mtime))
+            return data
+        except OSError:
+            return None
+
+    def _save_tile(self, path, data):
+        """Сохраняет тайл в кеш; без записи на диск карта всё равно строится из загруженного тайла"""
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as file:
+                file.write(data)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить тайл карты в кеш: {e}")
+
+    def _trim_tile_cache(self):
+        """Удаляет давно не использованные тайлы, пока кеш больше tile_cache_mb"""
+        files = []
+        for root, _, names in os.walk(_TILE_DIR):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_atime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        limit = self.config["tile_cache_mb"] * 1024 * 1024
+        for _, size, path in sorted(files):
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    async def on_unload(self):
+        if self._session is not None:
+            await self._session.close()
\ No newline at end of file